@@ -5,14 +5,19 @@ from evolve_structure import get_evolved_structure
 
 @click.command()
 @click.option('--name', default='myeffect', help='name of the effect to create')
+@click.option('--steady-state', is_flag=True, help='breed new models as soon as a worker is free, instead of once per generation')
+@click.option('--profile', is_flag=True, help='profile every model evaluation (saved in <name>/profiles/)')
+@click.option('--multi-fidelity', is_flag=True, help='fit each generation on a short excerpt first, and only fully optimize the best models')
+@click.option('--resume', is_flag=True, help='continue a previous run from its last checkpoint')
 @click.argument('dryfile', type=click.Path(exists=True))
 @click.argument('wetfile', type=click.Path(exists=True))
-def main(name, dryfile, wetfile):
+def main(name, steady_state, profile, multi_fidelity, resume, dryfile, wetfile):
     """
     Generates an effect to make DRYFILE sound like WETFILE
     """
     click.echo('Running Crossroads for {}'.format(name))
-    get_evolved_structure(name, dryfile, name + '/' + name + '.wav', wetfile)
+    get_evolved_structure(name, dryfile, name + '/' + name + '.wav', wetfile, steady_state=steady_state, profile=profile,
+                          multi_fidelity=multi_fidelity, resume=resume)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+"""
+Content-addressed cache of compiled plugins, so that a
+model structure that has been compiled before never needs
+to be compiled again
+"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+CACHE_DIR = 'faust_cache'
+MAX_CACHE_SIZE = 2**30 # bytes
+NAMES_FILE = 'names.json' # element names of the model that an entry was compiled from
+
+# Tools whose versions, and source files whose contents, are part of every key,
+# so that entries compiled with an older toolchain or harness are never re-used
+TOOLCHAIN_VERSION_ARGS = [['faust', '--version'], ['g++', '--version']]
+HARNESS_FILES = ['crossroads_scripts/faust_mysndfile.cpp']
+toolchain_key = None # computed once per process, see get_toolchain_key()
+
+# Number of cache hits and misses in this process
+stats = {'hits': 0, 'misses': 0}
+
+def get_model_key(model, kind, parametric=False):
+    """
+    Returns the cache key for a model compiled to a given kind of plugin.
+    Parametric plugins are keyed by structure only, otherwise the
+    parameter values (which are compiled into the plugin) are included.
+    """
+    string = get_toolchain_key() + ':' + kind + ':' + model.get_topology()
+    if not parametric:
+        params, _ = model.get_params()
+        string += ':' + ','.join('{:.17g}'.format(p) for p in params)
+
+    return hashlib.sha1(string.encode()).hexdigest()
+
+def get_toolchain_key():
+    """
+    Returns a hash of the toolchain versions and harness sources (see TOOLCHAIN_VERSION_ARGS
+    and HARNESS_FILES). Missing tools or files are hashed as such, rather than failing,
+    so that the cache can still be used where only part of the toolchain is installed.
+    """
+    global toolchain_key
+    if toolchain_key is None:
+        h = hashlib.sha1()
+        for args in TOOLCHAIN_VERSION_ARGS:
+            try:
+                result = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        universal_newlines=True, timeout=10)
+                h.update(result.stdout.encode())
+            except (OSError, subprocess.TimeoutExpired):
+                h.update(b'missing')
+        for file in HARNESS_FILES:
+            try:
+                with open(file, 'rb') as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(b'missing')
+        toolchain_key = h.hexdigest()
+
+    return toolchain_key
+
+def copy_path(src, dst):
+    """Copy a file or directory"""
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+def get_size(path):
+    """Total size in bytes of a file or directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size
+
+def rename_elements(path, names):
+    """
+    Rename elements in the files (names and contents) of a directory,
+    where `names` maps old element names to new ones
+    """
+    names = {old: new for old, new in names.items() if old != new}
+    if not names:
+        return
+
+    pattern = re.compile('|'.join(re.escape(old) for old in sorted(names, key=len, reverse=True)))
+    for root, _, files in os.walk(path):
+        for f in files:
+            file = os.path.join(root, f)
+            with open(file, encoding='utf-8', errors='surrogateescape') as fp:
+                contents = fp.read()
+            with open(file, 'w', encoding='utf-8', errors='surrogateescape') as fp:
+                fp.write(pattern.sub(lambda m: names[m.group(0)], contents))
+            os.rename(file, os.path.join(root, pattern.sub(lambda m: names[m.group(0)], f)))
+
+def fetch(key, files, names=None):
+    """
+    Copy cached artifacts to their destinations.
+    `files` maps artifact names to destination paths.
+    If `names` (the element names of the model, see Model.get_names()) is given,
+    the elements are renamed in artifacts that are directories (e.g. svgs),
+    from the names of the model that the entry was stored for (if stored with names).
+
+    Each artifact is copied next to its destination and then renamed, so
+    destinations are never partially written. Returns False if the key
+    (or any artifact) is not in the cache, or was evicted while copying.
+    """
+    entry = os.path.join(CACHE_DIR, key)
+    staged = {}
+    try:
+        if names is not None and os.path.exists(os.path.join(entry, NAMES_FILE)):
+            with open(os.path.join(entry, NAMES_FILE)) as f:
+                names = dict(zip(json.load(f), names))
+        else:
+            names = None
+
+        for f, dst in files.items():
+            stage_dir = tempfile.mkdtemp(dir=os.path.dirname(dst) or '.', prefix='.tmp_')
+            staged[dst] = stage_dir
+            copy_path(os.path.join(entry, f), os.path.join(stage_dir, f))
+            if names is not None and os.path.isdir(os.path.join(stage_dir, f)):
+                rename_elements(os.path.join(stage_dir, f), names)
+    except OSError: # not in the cache, or evicted by another process
+        for stage_dir in staged.values():
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        stats['misses'] += 1
+        return False
+
+    for (f, dst), stage_dir in zip(files.items(), staged.values()):
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        elif os.path.exists(dst):
+            os.remove(dst)
+        os.rename(os.path.join(stage_dir, f), dst)
+        os.rmdir(stage_dir)
+
+    try:
+        os.utime(entry) # mark as recently used
+    except OSError: # evicted since
+        pass
+    stats['hits'] += 1
+    return True
+
+def store(key, files, names=None, max_size=MAX_CACHE_SIZE):
+    """
+    Add artifacts to the cache. `files` maps artifact names to source paths.
+    `names` are the element names of the model, if any artifacts contain them (see fetch()).
+    Nothing is stored if any of the sources are missing (i.e. compilation failed).
+    """
+    entry = os.path.join(CACHE_DIR, key)
+    if os.path.exists(entry) or not all(os.path.exists(src) for src in files.values()):
+        return
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # build the entry in a temporary directory, so that
+    # other processes never see a partially written entry
+    tmp_dir = tempfile.mkdtemp(dir=CACHE_DIR, prefix='.tmp_')
+    for f, src in files.items():
+        copy_path(src, os.path.join(tmp_dir, f))
+    if names is not None:
+        with open(os.path.join(tmp_dir, NAMES_FILE), 'w') as f:
+            json.dump(names, f)
+
+    try:
+        os.rename(tmp_dir, entry)
+    except OSError: # entry was stored by another process
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    evict(max_size)
+
+def evict(max_size=MAX_CACHE_SIZE):
+    """Remove least recently used entries until the cache is smaller than `max_size`"""
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for key in os.listdir(CACHE_DIR):
+        if key.startswith('.tmp_'):
+            continue
+        entry = os.path.join(CACHE_DIR, key)
+        try:
+            entries.append((os.path.getmtime(entry), get_size(entry), entry))
+        except OSError: # entry removed by another process
+            continue
+
+    total = sum(e[1] for e in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+def clear():
+    """Remove all entries from the cache"""
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
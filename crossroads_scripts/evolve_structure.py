@@ -3,102 +3,306 @@ Genetic algorithm for evolving the structure of an audio effect
 """
 
 import numpy as np
-from gen_faust import Model,Element,Gain,UnitDelay,Delay,CubicNL,Split,Feedback
+from gen_faust import Model,Element,Gain,UnitDelay,CubicNL,Split
 from param_estimation import estimate_params,get_error_for_model,optimize_model
-from plugin_utils import compile_plugin, test_plugin
+from plugin_utils import compile_model, test_plugin, scratch_dir, SharedWavs, attach_shared_wavs, write_transient_excerpt
+from toolchain import ToolchainError, get_timing_summary
+from telemetry import Telemetry, profile_call
+from fitness_memo import FitnessMemo, get_target_fingerprint, MEMO_FILE
+from model_ir import ModelIR
+import compile_cache
+import functools
 import multiprocessing as mp
+import queue
 import random
+import pickle
 import os
 import time
 
-def compute_model_fitness(model,plugin,dry_file,wet_file,des_file,tol):
-    """Performs parameter estimation and error calculation for a given model"""
-    params = optimize_model(model,plugin,dry_file,wet_file,des_file, tol=tol)
-    model.set_params(params)
-    error = get_error_for_model(params,model,plugin,dry_file,wet_file,des_file)   
+# Multi-fidelity evaluation (see evolve_generations())
+EXCERPT_LENGTH = 2.0 # seconds
+PROMOTE_FRACTION = 0.5
+
+def compute_model_fitness(model,plugin,dry_file,wet_file,des_file,tol,backend='python',verify=True,memo=None,prune_error=None,stats=None):
+    """
+    Performs parameter estimation and error calculation for a given model.
+    Parameters are estimated with the given backend, and the final error
+    is verified with the compiled Faust plugin (unless `verify` is False,
+    then the error from the given backend is used). All generated files
+    (including the wet file) are kept in a private scratch directory.
+    Models that fail to compile or run are given infinite error.
+
+    If a `memo` (see fitness_memo.FitnessMemo) is given, a structure that has
+    already been optimized for this target is not optimized again, and the
+    optimization is warm-started from the best stored structure that differs
+    only in delay lengths. Verified results are stored in the memo.
+
+    If `prune_error` is given, the optimization is stopped early when it is
+    unlikely to beat that error (see param_estimation.optimize_model()). Pruned
+    models are not verified or memoized, and are given the best error found so far.
+
+    If `stats` is a dict, optimization and verification times and
+    iteration counts are recorded in it.
+    """
+    stats = stats if stats is not None else {}
+    memo = memo if verify else None # only verified errors are memoized
+    if memo is not None:
+        entry = memo.lookup(model)
+        if entry is not None:
+            stats['memo'] = 'hit'
+            model.set_params(entry[0])
+            return entry[1], model
+
+        entry = memo.lookup_near(model)
+        if entry is not None:
+            stats['memo'] = 'warm'
+            model.set_params(entry[0])
+        else:
+            stats['memo'] = 'miss'
+
+    with scratch_dir(plugin) as directory:
+        wet_file = os.path.join(directory, os.path.basename(wet_file))
+        try:
+            tick = time.perf_counter()
+            params = optimize_model(model,plugin,dry_file,wet_file,des_file, tol=tol, backend=backend, directory=directory, stats=stats,
+                                    prune_error=prune_error)
+            stats['optimize_time'] = time.perf_counter() - tick
+
+            model.set_params(params)
+            if stats['pruned']:
+                return stats['pruned_error'], model
+
+            tick = time.perf_counter()
+            error = get_error_for_model(params,model,plugin,dry_file,wet_file,des_file,
+                                        backend='faust' if verify else backend, directory=directory)
+            stats['verify_time'] = time.perf_counter() - tick
+
+            if memo is not None:
+                memo.store(model, params, error)
+        except ToolchainError as e:
+            print('Unable to evaluate model: {}\n{}'.format(model, e))
+            error = np.inf
 
-    # clean up residual files
-    os.system('rm ' + wet_file)
-    os.system(f'rm faust_scripts/{plugin}.dsp')
     return error, model
 
-def get_evolved_structure(plugin,dry_file,wet_file,des_file, tol=1e-5):
+def compute_model_fitness_job(job):
+    """
+    Wrapper for compute_model_fitness() for use with Pool.imap_unordered().
+    `job` is (n, args, profile_file), returns (n, error, model, stats) where
+    `n` identifies the job (e.g. its index), and `stats` contains the
+    evaluation metrics for telemetry. If `profile_file`
+    is not None, the evaluation is profiled with cProfile.
+    Models are sent to and from the workers as ModelIRs (see get_fitness_args()).
+    """
+    n, args, profile_file = job
+    args = (args[0].to_model(),) + args[1:]
+    cache_stats = dict(compile_cache.stats)
+    tool_times = get_timing_summary()
+
+    stats = {}
+    tick = time.perf_counter()
+    error, model = profile_call(profile_file, functools.partial(compute_model_fitness, stats=stats), *args)
+    stats['eval_time'] = time.perf_counter() - tick
+
+    stats['pid'] = os.getpid()
+    stats['cache_hits'] = compile_cache.stats['hits'] - cache_stats['hits']
+    stats['cache_misses'] = compile_cache.stats['misses'] - cache_stats['misses']
+    stats['toolchain'] = {step: t - tool_times.get(step, (0, 0.0))[1] for step, (_, t) in get_timing_summary().items()}
+    if profile_file is not None:
+        stats['profile'] = profile_file
+
+    return n, error, ModelIR.from_model(model), stats
+
+def get_profile_file(plugin, profile, gen_num, n, stage='full'):
+    """Profile file for evaluation `n` of a generation (None if not profiling)"""
+    suffix = '' if stage == 'full' else '_' + stage
+    return os.path.join(plugin, 'profiles', 'gen{}_{}{}.prof'.format(gen_num, n, suffix)) if profile else None
+
+def emit_evaluation(telemetry, gen_num, n, error, model, stats):
+    """Record the result of one model evaluation"""
+    params, _ = model.get_params()
+    telemetry.emit('evaluation', generation=gen_num, index=n, model=str(model),
+                   num_params=len(params), error=float(error), **stats)
+
+def get_fitness_args(model,n,plugin,dry_file,wet_file,des_file,tol,verify=True,memo=None,prune_error=None):
+    """
+    Arguments to compute_model_fitness(), using separate files for each worker slot `n`.
+    The model is passed as a ModelIR, which is much smaller to send to a worker
+    (it has no element names or processing state).
+    """
+    return (ModelIR.from_model(model),plugin+f'_{n}',dry_file,wet_file[:-4]+f'_{n}'+wet_file[-4:],des_file,tol,'python',verify,memo,prune_error)
+
+def get_prune_error(errors, N_survive):
+    """
+    Error that a new model must be able to beat to survive (the error of the
+    worst current survivor), or None if there are not yet N_survive survivors
+    """
+    if len(errors) < N_survive or not np.isfinite(errors[N_survive-1]):
+        return None
+    return float(errors[N_survive-1])
+
+def get_evolved_structure(plugin,dry_file,wet_file,des_file, tol=1e-5, steady_state=False, callback=None, profile=False,
+                          multi_fidelity=False, memo_file=MEMO_FILE, resume=False):
     """
     Evolve a structure for an audio effect that processes the dry audio
-    to sound like the desired audio
+    to sound like the desired audio. If `steady_state` is True, new models
+    are bred as soon as any worker is free, instead of once per generation.
+
+    Telemetry events (see telemetry.Telemetry) are logged to `{plugin}/telemetry.jsonl`,
+    and passed to `callback` if given. If `profile` is True, every evaluation
+    is profiled with cProfile, and saved in `{plugin}/profiles/`.
+
+    If `multi_fidelity` is True (generational evolution only), each generation is
+    first fit and scored on a short transient-rich excerpt of the audio, and only
+    the best models are optimized on the full audio (see evolve_generations()).
+
+    Optimized structures are memoized in `memo_file` (see fitness_memo.FitnessMemo),
+    so they are not optimized again in later generations or runs with the same audio.
+    Set `memo_file` to None to disable this.
+
+    A checkpoint is saved in `{plugin}/` after every generation. If `resume` is True,
+    the evolution continues from the last checkpoint of a previous run.
     """
     N_pop = 4
     N_gens = 10
     N_survive = 3
 
-    res = os.system('mkdir {}'.format(plugin))
-    if (res > 0):
-        exit(res)
+    if resume and not os.path.exists(os.path.join(plugin, 'checkpoint.pkl')):
+        print('No checkpoint to resume from in {}/'.format(plugin))
+        exit(1)
+
+    if not resume:
+        res = os.system('mkdir {}'.format(plugin))
+        if (res > 0):
+            exit(res)
+
+    checkpoint = None
+    if resume: # (before creating a generation, which would use up random numbers)
+        checkpoint = load_checkpoint(plugin)
+        if (checkpoint['mode'] == 'steady_state') != steady_state:
+            print('Checkpoint was saved in {} mode'.format(checkpoint['mode']))
+            exit(1)
+        models = list(checkpoint['models'])
+        print('Resuming from generation: {}'.format(checkpoint['gen_num']))
+    else:
+        # create initial model parents
+        models = []
 
-    # create initial model parents
-    models = []
-    
-    model1 = Model()
-    model1.elements.append(Gain())
-    models.append(model1)
+        model1 = Model()
+        model1.elements.append(Gain())
+        models.append(model1)
 
-    model2 = Model()
-    model2.elements.append(UnitDelay())
-    models.append(model2)
+        model2 = Model()
+        model2.elements.append(UnitDelay())
+        models.append(model2)
 
-    model3 = Model()
-    model3.elements.append(Split([[Gain()], [UnitDelay(), Gain()]]))
-    models.append(model3)
+        model3 = Model()
+        model3.elements.append(Split([[Gain()], [UnitDelay(), Gain()]]))
+        models.append(model3)
 
-    # create initial generation
-    models = create_generation(models, N_pop, N_survive)
+        # create initial generation
+        models = create_generation(models, N_pop, N_survive)
 
+    memo = FitnessMemo(memo_file, get_target_fingerprint(dry_file, des_file)) if memo_file is not None else None
+
+    elapsed = time.time()
+    with Telemetry(os.path.join(plugin, 'telemetry.jsonl'), [callback]) as telemetry:
+        telemetry.emit('start', plugin=plugin, dry_file=dry_file, des_file=des_file, tol=tol, steady_state=steady_state,
+                       num_workers=mp.cpu_count(), resumed_from=checkpoint['gen_num'] if checkpoint is not None else None)
+
+        with scratch_dir(plugin) as directory:
+            excerpt = None
+            if multi_fidelity and not steady_state:
+                excerpt = write_transient_excerpt(dry_file, des_file, EXCERPT_LENGTH, directory)
+
+            # dry and desired audio are loaded once, and shared with every worker
+            with SharedWavs([dry_file, des_file] + list(excerpt or [])) as shared_wavs, \
+                 mp.Pool(mp.cpu_count(), initializer=attach_shared_wavs, initargs=(shared_wavs,)) as pool:
+                if steady_state:
+                    models, errors, converge = evolve_steady_state(pool, models, N_pop, N_gens, N_survive,
+                                                                   plugin, dry_file, wet_file, des_file, tol, telemetry, profile, memo, checkpoint)
+                else:
+                    models, errors, converge = evolve_generations(pool, models, N_pop, N_gens, N_survive,
+                                                                  plugin, dry_file, wet_file, des_file, tol, telemetry, profile, excerpt, memo, checkpoint)
+                pool.close()
+                pool.join()
+
+        if converge:
+            print('Converged!')
+        else:
+            print('Not Converged')
+
+        print('Best error: {}'.format(errors[0]))
+        print('Time elapsed: {}'.format(time.time() - elapsed))
+        telemetry.emit('run', converged=converge, best_error=float(errors[0]), best_model=str(models[0]),
+                       wall_time=time.time() - elapsed)
+
+    # Save final faust script and plugin
+    try:
+        compile_model(models[0], plugin)
+        test_plugin(plugin, dry_file, wet_file)
+    except ToolchainError as e:
+        print('Unable to save final plugin: {}\n{}'.format(models[0], e))
+        return models[0]
+    os.system('cp -R faust_plugins/{} {}/gen_final'.format(plugin, plugin))
+    os.system('cp faust_scripts/{}.dsp {}/gen_final/'.format(plugin, plugin))
+
+    return models[0]
+
+def evolve_generations(pool, models, N_pop, N_gens, N_survive, plugin, dry_file, wet_file, des_file, tol, telemetry, profile=False,
+                       excerpt=None, memo=None, checkpoint=None):
+    """
+    Generational evolution: every model in a generation is evaluated
+    before breeding the next generation from the survivors.
+
+    If `excerpt` (dry and desired excerpt files) is given, every model is first
+    fit and scored on the excerpt (with the Python backend only), and only the best
+    PROMOTE_FRACTION (at least N_survive) are promoted to full optimization,
+    starting from their excerpt parameters. The rest are given infinite error.
+
+    Optimizations in the full pass are stopped early once they are unlikely
+    to beat the worst survivor of the previous generation (see get_prune_error()).
+
+    A checkpoint is saved after every generation (see save_checkpoint()),
+    and the evolution continues from `checkpoint` if given.
+    Returns the surviving models, their errors, and whether the evolution converged
+    """
     gen_num = 0
+    errors = np.zeros(0)
     converge = False
-    elapsed = time.time()
-    while gen_num < N_gens:
+    if checkpoint is not None:
+        gen_num, models, errors, N_pop, converge = (checkpoint[k] for k in ('gen_num', 'models', 'errors', 'N_pop', 'converged'))
+
+    while gen_num < N_gens and not converge:
         # test current generation
         print('Testing generation: {}'.format(gen_num))
         for n in range(N_pop):
             print(models[n])
 
-        pool = mp.Pool(mp.cpu_count())
-        results = pool.starmap(compute_model_fitness, [(models[n],plugin+f'_{n}',
-            dry_file,wet_file[:-4]+f'_{n}'+wet_file[-4:],des_file,tol) for n in range(N_pop)])
-        pool.close()
-        
-        errors = np.zeros(N_pop)
-        models = []
-        for n in range(N_pop):
-            errors[n] = results[n][0]
-            models.append(results[n][1])
-
-        # sort
-        aridxs = np.argsort(errors)
-        errors = errors[aridxs]
-        models = [models[i] for i in aridxs]
-
-        # reorganize to prefer smaller structures
-        n_perfect = 0
-        for n in range(N_survive):
-            if errors[n] < 5.0e-07: n_perfect += 1
-        
-        if n_perfect > 1:
-            n_params = []
-            for n in range(n_perfect):
-                params,_ = models[n].get_params()
-                n_params.append(len(params))
-            
-            aridxs = np.argsort(n_params)
-            errors[:n_perfect] = errors[:n_perfect][aridxs]
-            models[:n_perfect] = [models[:n_perfect][i] for i in aridxs]
+        gen_start = time.time()
+        busy_time = 0.0
+        promoted = range(N_pop)
+        if excerpt is not None:
+            # coarse pass, on the excerpt
+            jobs = [(n, get_fitness_args(models[n],n,plugin,excerpt[0],wet_file,excerpt[1],tol,verify=False),
+                     get_profile_file(plugin,profile,gen_num,n,'coarse')) for n in range(N_pop)]
+            coarse_errors = np.zeros(N_pop)
+            busy_time += run_fitness_jobs(pool, jobs, models, coarse_errors, telemetry, gen_num, 'coarse')
+
+            N_promote = max(N_survive, int(np.ceil(PROMOTE_FRACTION * N_pop)))
+            promoted = np.argsort(coarse_errors)[:N_promote].tolist() # plain ints, for telemetry
+
+        prune_error = get_prune_error(errors, N_survive)
+        jobs = [(n, get_fitness_args(models[n],n,plugin,dry_file,wet_file,des_file,tol,memo=memo,prune_error=prune_error),
+                 get_profile_file(plugin,profile,gen_num,n)) for n in promoted]
+        errors = np.full(N_pop, np.inf)
+        busy_time += run_fitness_jobs(pool, jobs, models, errors, telemetry, gen_num)
+
+        models, errors = sort_models(models, errors, N_survive)
+        emit_generation(telemetry, gen_num, time.time() - gen_start, N_pop, busy_time, errors[:N_survive])
 
         # save surviving faust files and plugins for later analysis
-        for n in range(N_survive):
-            models[n].write_to_file(plugin + '.dsp')
-            compile_plugin(plugin)
-            os.system('cp -R faust_plugins/{} {}/gen{}_{}'.format(plugin, plugin, gen_num, n))
-            os.system('cp faust_scripts/{}.dsp {}/gen{}_{}/'.format(plugin, plugin, gen_num, n))
+        save_survivors(models, plugin, gen_num, N_survive)
 
         # Take survivors
         errors = errors[:N_survive]
@@ -109,46 +313,211 @@ def get_evolved_structure(plugin,dry_file,wet_file,des_file, tol=1e-5):
         # check for correct answer
         if errors[0] <= tol:
             converge = True
-            break
-
-        # mutate off survivors
-        if N_pop < 24:
-            N_pop += 4
-        create_generation(models, N_pop, N_survive)
+        else: # mutate off survivors
+            if N_pop < 24:
+                N_pop += 4
+            create_generation(models, N_pop, N_survive)
 
         gen_num += 1
+        save_checkpoint(plugin, {'mode': 'generations', 'gen_num': gen_num, 'models': models, 'errors': errors,
+                                 'N_pop': N_pop, 'converged': converge})
 
-    if converge:
-        print('Converged!')
-    else:
-        print('Not Converged')
+    return models[:N_survive], errors, converge
 
-    print('Best error: {}'.format(errors[0]))
-    print('Time elapsed: {}'.format(time.time() - elapsed))
+def evolve_steady_state(pool, models, N_pop, N_gens, N_survive, plugin, dry_file, wet_file, des_file, tol, telemetry, profile=False,
+                        memo=None, checkpoint=None):
+    """
+    Steady-state evolution: as soon as any worker finishes evaluating a model,
+    a new child is bred from the current survivors and sent to that worker.
+    Every N_pop evaluations (growing as in evolve_generations()) are reported
+    and saved as one generation, along with a checkpoint (see save_checkpoint()).
+    Optimizations are stopped early once they are unlikely to beat the worst
+    current survivor (see get_prune_error()).
+    The evolution continues from `checkpoint` if given (models that were still
+    being evaluated when the checkpoint was saved are not restored).
+    Returns the surviving models, their errors, and whether the evolution converged
+    """
+    results = queue.Queue()
+    free_slots = list(range(mp.cpu_count()))
+    in_flight = {} # worker slot -> model being evaluated
+    # jobs are identified by (worker slot, submission index); the submission
+    # index numbers both the job's profile file and its telemetry
+    pending = list(models)
+
+    survivors = []
+    survivor_errors = np.zeros(0)
+    gen_num = 0
+    gen_size = N_pop
+    n_done = 0
+    n_sent = 0
+    converge = False
+    gen_start = time.time()
+    busy_time = 0.0
+    if checkpoint is not None:
+        pending = []
+        survivors, survivor_errors, gen_num, gen_size, n_done, N_pop, converge = (checkpoint[k] for k in
+            ('models', 'errors', 'gen_num', 'gen_size', 'n_done', 'N_pop', 'converged'))
+        n_sent = n_done
+
+    while True:
+        # keep every worker busy (unless finished)
+        while free_slots and not converge and gen_num < N_gens:
+            if pending:
+                child = pending.pop(0)
+            elif survivors:
+                candidates = survivors + list(in_flight.values())
+                child = create_generation(candidates, len(candidates) + 1, len(survivors))[-1]
+            else: # wait for the first survivors
+                break
 
-    # Save final faust script and plugin
-    models[0].write_to_file(plugin + '.dsp')
-    compile_plugin(plugin)
-    test_plugin(plugin, dry_file, wet_file)
-    os.system('cp -R faust_plugins/{} {}/gen_final'.format(plugin, plugin))
-    os.system('cp faust_scripts/{}.dsp {}/gen_final/'.format(plugin, plugin))
+            slot = free_slots.pop(0)
+            in_flight[slot] = child
+            print(child)
+            job = ((slot, n_sent), get_fitness_args(child,slot,plugin,dry_file,wet_file,des_file,tol,memo=memo,
+                                          prune_error=get_prune_error(survivor_errors, N_survive)),
+                   get_profile_file(plugin,profile,gen_num,n_sent))
+            pool.apply_async(compute_model_fitness_job, (job,), callback=results.put, error_callback=results.put)
+            n_sent += 1
 
-    return models[0]
+        if not in_flight:
+            break
+
+        result = results.get()
+        if isinstance(result, Exception):
+            raise result
+
+        (slot, index), error, model_ir, stats = result
+        model = model_ir.to_model()
+        del in_flight[slot]
+        free_slots.append(slot)
+        emit_evaluation(telemetry, gen_num, index, error, model, stats)
+        busy_time += stats['eval_time']
+        if converge or gen_num >= N_gens: # draining remaining workers
+            continue
+
+        survivors, survivor_errors = sort_models(survivors + [model], np.append(survivor_errors, error), N_survive)
+        survivors = survivors[:N_survive]
+        survivor_errors = survivor_errors[:N_survive]
+
+        n_done += 1
+        if n_done == gen_size:
+            print('Finished generation: {}'.format(gen_num))
+            emit_generation(telemetry, gen_num, time.time() - gen_start, N_pop, busy_time, survivor_errors)
+            gen_start = time.time()
+            busy_time = 0.0
+            save_survivors(survivors, plugin, gen_num, len(survivors))
+            print('Surviving errors: {}'.format(survivor_errors))
+
+            # check for correct answer
+            if survivor_errors[0] <= tol:
+                converge = True
+
+            if N_pop < 24:
+                N_pop += 4
+            gen_size += N_pop
+            gen_num += 1
+            save_checkpoint(plugin, {'mode': 'steady_state', 'gen_num': gen_num, 'models': survivors, 'errors': survivor_errors,
+                                     'N_pop': N_pop, 'gen_size': gen_size, 'n_done': n_done, 'converged': converge})
+
+    return survivors, survivor_errors, converge
+
+def save_checkpoint(plugin, state):
+    """
+    Save the state of the evolution (along with the state of the random number
+    generators) to `{plugin}/checkpoint.pkl`, replacing the previous checkpoint atomically.
+    The models are saved as ModelIRs.
+    """
+    state = dict(state, models=[ModelIR.from_model(m) for m in state['models']],
+                 random_state=random.getstate(), np_random_state=np.random.get_state())
+    checkpoint_file = os.path.join(plugin, 'checkpoint.pkl')
+    with open(checkpoint_file + '.tmp', 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+def load_checkpoint(plugin):
+    """Load the last checkpoint saved by save_checkpoint(), and restore the random number generators"""
+    with open(os.path.join(plugin, 'checkpoint.pkl'), 'rb') as f:
+        state = pickle.load(f)
+    state['models'] = [ir.to_model() for ir in state['models']]
+
+    random.setstate(state['random_state'])
+    np.random.set_state(state['np_random_state'])
+    return state
+
+def run_fitness_jobs(pool, jobs, models, errors, telemetry, gen_num, stage='full'):
+    """
+    Run fitness jobs on the worker pool, storing the resulting models and
+    errors by index as they finish. Returns the total time spent evaluating.
+    """
+    busy_time = 0.0
+    for n, error, model_ir, stats in pool.imap_unordered(compute_model_fitness_job, jobs):
+        model = model_ir.to_model()
+        errors[n] = error
+        models[n] = model
+        busy_time += stats['eval_time']
+        emit_evaluation(telemetry, gen_num, n, error, model, dict(stats, stage=stage))
+    return busy_time
+
+def emit_generation(telemetry, gen_num, wall_time, num_evaluations, busy_time, errors):
+    """Record the end of a generation, with the fraction of time that the worker pool was busy"""
+    telemetry.emit('generation', generation=gen_num, wall_time=wall_time, num_evaluations=num_evaluations,
+                   utilization=busy_time / (wall_time * mp.cpu_count()), errors=[float(e) for e in errors])
+
+def sort_models(models, errors, N_survive):
+    """Sort models by error, preferring smaller structures amongst the (near) perfect survivors"""
+    aridxs = np.argsort(errors)
+    errors = np.array(errors)[aridxs]
+    models = [models[i] for i in aridxs]
+
+    # reorganize to prefer smaller structures
+    n_perfect = 0
+    for n in range(min(N_survive, len(models))):
+        if errors[n] < 5.0e-07: n_perfect += 1
+    
+    if n_perfect > 1:
+        n_params = []
+        for n in range(n_perfect):
+            params,_ = models[n].get_params()
+            n_params.append(len(params))
+        
+        aridxs = np.argsort(n_params)
+        errors[:n_perfect] = errors[:n_perfect][aridxs]
+        models[:n_perfect] = [models[:n_perfect][i] for i in aridxs]
+
+    return models, errors
+
+def save_survivors(models, plugin, gen_num, N_survive):
+    """Save surviving faust files and plugins for later analysis (skipping any that fail to compile)"""
+    for n in range(N_survive):
+        try:
+            compile_model(models[n], plugin)
+        except ToolchainError as e:
+            print('Unable to save survivor: {}\n{}'.format(models[n], e))
+            continue
+        os.system('cp -R faust_plugins/{} {}/gen{}_{}'.format(plugin, plugin, gen_num, n))
+        os.system('cp faust_scripts/{}.dsp {}/gen{}_{}/'.format(plugin, plugin, gen_num, n))
 
 
 def create_generation(models, N, N_survive):
-    """create a generation of models from first two in existing list"""
+    """
+    create a generation of models from first two in existing list. Children
+    with the same structure as an existing model (see Model.get_canonical())
+    are discarded, whatever their parameter values.
+    """
+    structures = set(m.get_structure_hash() for m in models)
     while len(models) < N:
         parent1 = random.choice(models[:N_survive])
         parent2 = random.choice(models[:N_survive])
-        models.append(get_mutated_model(parent1, parent2))
+        child = get_mutated_model(parent1, parent2)
 
         # check for duplicates
-        for m in models[:-1]:
-            if m == models[-1]:
-                print('Duplicate detected! Mutating again...')
-                models.pop()
-                break
+        structure = child.get_structure_hash()
+        if structure in structures:
+            print('Duplicate detected! Mutating again...')
+            continue
+
+        structures.add(structure)
+        models.append(child)
 
     return models
 
@@ -156,7 +525,12 @@ def create_generation(models, N, N_survive):
 mutation_strategies = ['concat_series', 'concat_parallel', 'add_gain', 'add_delay', 'add_nl', 'add_split', 'add_chain']
 
 def get_mutated_model(parent1, parent2):
-    """Create a new model by mutating existing models"""
+    """
+    Create a new model by mutating existing models. Children inherit
+    the fitted parameter values of their parents, and new gains in
+    parallel branches start at zero, so that optimization of the child
+    starts close to its parent.
+    """
 
     strategy = random.choice(mutation_strategies) # choose strategy randomly (eventually maybe use weighting?)
     new_model = Model()
@@ -191,7 +565,7 @@ def get_mutated_model(parent1, parent2):
     elif strategy == 'add_split':
         parent_to_add = random.choice([parent1, parent2])
         new_model.elements = copy_elements(parent_to_add.elements)
-        add_element(new_model, Split([[Gain()], [UnitDelay(), Gain()]]))
+        add_element(new_model, Split([[Gain()], [UnitDelay(), Gain(0.0)]]))
 
     elif strategy == 'add_chain': # add new chain to existing parallel structure in parent
         parent_to_add = random.choice([parent1, parent2])
@@ -207,7 +581,7 @@ def get_mutated_model(parent1, parent2):
             return get_mutated_model(parent1, parent2)
 
         split_idx = random.choice(split_idxs)
-        new_model.elements[split_idx].elements.append([UnitDelay(), Gain()])
+        new_model.elements[split_idx].elements.append([UnitDelay(), Gain(0.0)])
 
 
     else:
@@ -220,25 +594,10 @@ def get_mutated_model(parent1, parent2):
 
 
 def copy_elements(elements):
-    """Returns a deep copy of a list of elements"""
-    new_elements = []
-    for e in elements:
-        if isinstance(e, Gain):
-            new_elements.append(Gain())
-        elif isinstance(e, UnitDelay):
-            new_elements.append(UnitDelay())
-        elif isinstance(e, Delay):
-            new_elements.append(Delay(e.length))
-        elif isinstance(e, Split):
-            chains = []
-            for chain in e.elements:
-                chains.append(copy_elements(chain))
-            new_elements.append(Split(chains))
-        elif isinstance(e, Feedback):
-            fb_elements = copy_elements(e.elements)
-            new_elements.append(Feedback(fb_elements))
-
-    return new_elements
+    """Returns a deep copy of a list of elements (with new names), including their parameter values"""
+    model = Model()
+    model.elements = elements
+    return ModelIR.from_model(model).to_model().elements
 
 def add_element(model, element_to_add):
     """Adds an element to a randomly selected chain within the model"""
@@ -45,6 +45,10 @@
 #include <string>
 #include <map>
 #include <iostream>
+#include <sstream>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
 
 #include "faust/gui/UI.h"
 #include "faust/dsp/dsp.h"
@@ -172,6 +176,93 @@ class Interleaver
 };
 /***END DSP tools***/
 
+/***Parameter tools***/
+// Collects the zones of all sliders labelled "p<idx>" so that
+// parameter values can be set from the command line or stdin
+class ParamUI : public UI
+{
+
+    private:
+
+        std::map<int, FAUSTFLOAT*> fZones;
+
+        void addZone(const char* label, FAUSTFLOAT* zone)
+        {
+            int idx;
+            if (sscanf(label, "p%d", &idx) == 1) {
+                fZones[idx] = zone;
+            }
+        }
+
+    public:
+
+        // -- widget's layouts
+        void openTabBox(const char* label) {}
+        void openHorizontalBox(const char* label) {}
+        void openVerticalBox(const char* label) {}
+        void closeBox() {}
+
+        // -- active widgets
+        void addButton(const char* label, FAUSTFLOAT* zone) {}
+        void addCheckButton(const char* label, FAUSTFLOAT* zone) {}
+        void addVerticalSlider(const char* label, FAUSTFLOAT* zone, FAUSTFLOAT init, FAUSTFLOAT min, FAUSTFLOAT max, FAUSTFLOAT step) { addZone(label, zone); }
+        void addHorizontalSlider(const char* label, FAUSTFLOAT* zone, FAUSTFLOAT init, FAUSTFLOAT min, FAUSTFLOAT max, FAUSTFLOAT step) { addZone(label, zone); }
+        void addNumEntry(const char* label, FAUSTFLOAT* zone, FAUSTFLOAT init, FAUSTFLOAT min, FAUSTFLOAT max, FAUSTFLOAT step) { addZone(label, zone); }
+
+        // -- passive widgets
+        void addHorizontalBargraph(const char* label, FAUSTFLOAT* zone, FAUSTFLOAT min, FAUSTFLOAT max) {}
+        void addVerticalBargraph(const char* label, FAUSTFLOAT* zone, FAUSTFLOAT min, FAUSTFLOAT max) {}
+
+        // -- soundfiles
+        void addSoundfile(const char* label, const char* filename, Soundfile** sf_zone) {}
+
+        void declare(FAUSTFLOAT* zone, const char* key, const char* val) {}
+
+        int getNumParams() { return (int) fZones.size(); }
+
+        // returns false if there is no parameter with this index
+        bool setParam(int idx, FAUSTFLOAT value)
+        {
+            if (fZones.find(idx) == fZones.end()) {
+                return false;
+            }
+            *fZones[idx] = value;
+            return true;
+        }
+};
+
+// Sets parameter values (in order), returns false if there are too many
+bool setParams(ParamUI& params, const std::vector<double>& values)
+{
+    for (size_t i = 0; i < values.size(); i++) {
+        if (! params.setParam((int) i, (FAUSTFLOAT) values[i])) {
+            fprintf(stderr, "*** Too many parameters: plugin has %d.\n", params.getNumParams());
+            return false;
+        }
+    }
+    return true;
+}
+
+// Reads parameter values (in order) from the remaining command line
+// arguments, or from stdin if the only remaining argument is "-"
+bool setParams(ParamUI& params, int argc, char* argv[])
+{
+    std::vector<double> values;
+    if (argc == 1 && strcmp(argv[0], "-") == 0) {
+        double value;
+        while (std::cin >> value) {
+            values.push_back(value);
+        }
+    } else {
+        for (int i = 0; i < argc; i++) {
+            values.push_back(atof(argv[i]));
+        }
+    }
+
+    return setParams(params, values);
+}
+/***END Parameter tools***/
+
 /******************************************************************************
  *******************************************************************************
  
@@ -213,11 +304,107 @@ mydsp DSP;
 
 #define kFrames 512
 
+/**
+ * Server mode: the input file is read once, and the output is rendered
+ * into a memory-mapped file (interleaved 32-bit float) each time a line
+ * of parameter values is received on stdin. After each render, "done"
+ * (or "error") is written to stdout. The server exits on "quit" or EOF.
+ */
+int runServer(const char* in_file, const char* shm_file)
+{
+    // read input file
+    SF_INFO in_info;
+    in_info.format = 0;
+    in_info.channels = 0;
+    SNDFILE* in_sf = sf_open(in_file, SFM_READ, &in_info);
+    if (in_sf == NULL) {
+        fprintf(stderr, "*** Input file not found.\n");
+        sf_perror(in_sf);
+        return 1;
+    }
+
+    const int numFrames = (int) in_info.frames;
+    const int numOutputs = DSP.getNumOutputs();
+    std::vector<FAUSTFLOAT> input(numFrames * in_info.channels);
+    READ_SAMPLE(in_sf, input.data(), numFrames);
+    sf_close(in_sf);
+
+    // map output file
+    const size_t outBytes = (size_t) numFrames * numOutputs * sizeof(float);
+    int fd = open(shm_file, O_RDWR | O_CREAT | O_TRUNC, 0600);
+    if (fd < 0 || ftruncate(fd, outBytes) != 0) {
+        fprintf(stderr, "*** Cannot create output file.\n");
+        return 1;
+    }
+
+    float* output = (float*) mmap(NULL, std::max<size_t>(outBytes, 1), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (output == MAP_FAILED) {
+        fprintf(stderr, "*** Cannot map output file.\n");
+        close(fd);
+        return 1;
+    }
+
+    Deinterleaver sep(kFrames, in_info.channels, DSP.getNumInputs());
+    Interleaver ilv(kFrames, numOutputs, numOutputs);
+
+    DSP.init(in_info.samplerate);
+    ParamUI params;
+    DSP.buildUserInterface(&params);
+
+    printf("ready %d %d %d\n", numFrames, numOutputs, in_info.samplerate);
+    fflush(stdout);
+
+    std::string line;
+    while (std::getline(std::cin, line) && line != "quit") {
+        std::vector<double> values;
+        std::istringstream stream(line);
+        double value;
+        while (stream >> value) {
+            values.push_back(value);
+        }
+
+        if (! setParams(params, values)) {
+            printf("error\n");
+            fflush(stdout);
+            continue;
+        }
+
+        // render from a cleared state
+        DSP.instanceClear();
+        for (int start = 0; start < numFrames; start += kFrames) {
+            int nbf = std::min(kFrames, numFrames - start);
+            memcpy(sep.input(), input.data() + start * in_info.channels, nbf * in_info.channels * sizeof(FAUSTFLOAT));
+            sep.deinterleave();
+            DSP.compute(nbf, sep.outputs(), ilv.inputs());
+            ilv.interleave();
+            for (int i = 0; i < nbf * numOutputs; i++) {
+                output[start * numOutputs + i] = (float) ilv.output()[i];
+            }
+        }
+
+        printf("done\n");
+        fflush(stdout);
+    }
+
+    munmap(output, std::max<size_t>(outBytes, 1));
+    close(fd);
+    return 0;
+}
+
+// Usage: <plugin> <input.wav> <output.wav> [p0 p1 ... | -]
+//        <plugin> --server <input.wav> <output.raw>
 int main(int argc, char* argv[])
 {
-    if (argc == 1) {
+    if (argc < 3) {
         exit(1);
     }
+
+    if (strcmp(argv[1], "--server") == 0) {
+        if (argc < 4) {
+            exit(1);
+        }
+        exit(runServer(argv[2], argv[3]));
+    }
     
     SNDFILE* in_sf;
     SNDFILE* out_sf;
@@ -254,6 +441,13 @@ int main(int argc, char* argv[])
 
     // init signal processor
     DSP.init(in_info.samplerate);
+
+    // set parameters (if the plugin was compiled with parameter sliders)
+    ParamUI params;
+    DSP.buildUserInterface(&params);
+    if (! setParams(params, argc - 3, argv + 3)) {
+        exit(1);
+    }
     
     // process all samples
     int nbf;
@@ -0,0 +1,108 @@
+"""
+Client for a faust2sndfile executable running in server mode,
+which renders the dry audio for new parameters without
+re-reading or writing any wav files
+"""
+
+import os
+import select
+import subprocess
+import tempfile
+import time
+import numpy as np
+from plugin_utils import SCRATCH_ROOT
+from toolchain import TIMEOUTS, ToolchainError
+
+class FaustServer:
+    """
+    Persistent faust2sndfile process for a plugin compiled with parameter
+    sliders (see param_estimation.compile_sndfile()). The dry audio is
+    loaded once by the server, and each render is returned through a
+    memory-mapped file. If the executable was compiled in a scratch
+    `directory`, the memory-mapped file is kept there as well.
+
+    Starting the server and each render are limited to TIMEOUTS['render']
+    seconds; if the server does not answer in time it is killed. If the server
+    fails to start or render (or times out), a toolchain.ToolchainError is raised.
+    """
+    def __init__(self, name, in_wav, directory=None):
+        fd, self.shm_file = tempfile.mkstemp(prefix=name + '-', suffix='.raw', dir=directory or SCRATCH_ROOT)
+        os.close(fd)
+
+        self.args = [os.path.join(directory or '.', name + '-sndfile'), '--server', in_wav, self.shm_file]
+        try:
+            self.proc = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        except OSError as e: # e.g. executable not compiled
+            os.remove(self.shm_file)
+            raise ToolchainError('render', self.args, e.errno, str(e))
+        self.buffer = b''
+
+        header = self.readline().split()
+        if len(header) != 4 or header[0] != 'ready':
+            self.close()
+            raise ToolchainError('render', self.args, self.proc.returncode, 'Unable to start Faust server for {}'.format(name))
+
+        num_frames, num_channels, self.fs = (int(h) for h in header[1:])
+        self.output = np.memmap(self.shm_file, dtype=np.float32, mode='r', shape=(num_frames, num_channels))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def render(self, params):
+        """Render the dry audio with the given parameters"""
+        try:
+            self.proc.stdin.write((' '.join('{:.17g}'.format(p) for p in params) + '\n').encode())
+        except BrokenPipeError: # server exited
+            self.close()
+            raise ToolchainError('render', self.args, self.proc.returncode, 'Faust server exited')
+
+        status = self.readline().strip()
+        if status != 'done':
+            self.close()
+            raise ToolchainError('render', self.args, self.proc.returncode, 'Faust server failed to render: {}'.format(status))
+
+        return np.array(self.output, dtype=float)
+
+    def readline(self, timeout=None):
+        """
+        Read one line of the server's output (without blocking for more than
+        `timeout` seconds, by default TIMEOUTS['render']). Returns an empty
+        string if the server exits. Kills the server on timeout.
+        """
+        timeout = timeout if timeout is not None else TIMEOUTS['render']
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                self.proc.kill()
+                self.proc.wait()
+                self.close()
+                raise ToolchainError('render', self.args, None, 'Faust server did not answer within {}s'.format(timeout))
+            data = os.read(fd, 4096)
+            if not data: # server exited
+                break
+            self.buffer += data
+
+        line, _, self.buffer = self.buffer.partition(b'\n')
+        return line.decode(errors='replace')
+
+    def close(self):
+        """Stop the server process and remove the shared output file"""
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write(b'quit\n')
+            except BrokenPipeError:
+                pass
+            try:
+                self.proc.wait(timeout=TIMEOUTS['render'])
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+
+        self.output = None
+        if os.path.exists(self.shm_file):
+            os.remove(self.shm_file)
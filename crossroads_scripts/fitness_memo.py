@@ -0,0 +1,84 @@
+"""
+Persistent memo of optimized model structures, so that a
+structure is never optimized twice for the same target audio
+(across generations, and across separate runs)
+"""
+
+import re
+import json
+import time
+import hashlib
+import sqlite3
+
+MEMO_FILE = 'fitness_memo.sqlite'
+
+def get_target_fingerprint(dry_file, des_file):
+    """Returns a fingerprint of the content of a dry/desired pair of audio files"""
+    sha = hashlib.sha1()
+    for wav_file in (dry_file, des_file):
+        with open(wav_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha.update(chunk)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+def get_family(structure):
+    """Structure with delay lengths removed, i.e. structures that can share parameters"""
+    return re.sub(r'Delay\(\d+\)', 'Delay', structure)
+
+class FitnessMemo:
+    """
+    SQLite memo of (model structure, target fingerprint) -> (best parameters, error).
+    The database connection is opened on first use in each process, so a memo
+    can be passed to pool workers. SQLite locking makes it safe for workers
+    (and separate runs) to share the same file.
+    """
+    def __init__(self, db_file, target):
+        self.db_file = db_file
+        self.target = target
+        self.db = None
+
+    def __getstate__(self):
+        return {'db_file': self.db_file, 'target': self.target, 'db': None}
+
+    def connect(self):
+        """Open the database, creating the table if needed"""
+        if self.db is None:
+            self.db = sqlite3.connect(self.db_file, timeout=60)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS memo (structure TEXT, family TEXT, target TEXT, '
+                            'params TEXT, error REAL, updated REAL, PRIMARY KEY (structure, target))')
+            self.db.execute('CREATE INDEX IF NOT EXISTS memo_family ON memo (family, target)')
+        return self.db
+
+    def lookup(self, model):
+        """Returns (params, error) stored for this model structure, or None"""
+        row = self.connect().execute('SELECT params, error FROM memo WHERE structure = ? AND target = ?',
+                                     (model.get_topology(), self.target)).fetchone()
+        return (json.loads(row[0]), row[1]) if row is not None else None
+
+    def lookup_near(self, model):
+        """
+        Returns (params, error) for the best stored structure that differs from
+        this model only in delay lengths (a good starting point), or None
+        """
+        row = self.connect().execute('SELECT params, error FROM memo WHERE family = ? AND target = ? ORDER BY error LIMIT 1',
+                                     (get_family(model.get_topology()), self.target)).fetchone()
+        return (json.loads(row[0]), row[1]) if row is not None else None
+
+    def store(self, model, params, error):
+        """Store the parameters and error for a model structure (if better than any stored already)"""
+        structure = model.get_topology()
+        params, error, updated = json.dumps([float(p) for p in params]), float(error), time.time()
+        # (INSERT ... ON CONFLICT DO UPDATE needs SQLite 3.24, so insert and update separately, in one transaction)
+        with self.connect() as db:
+            db.execute('INSERT OR IGNORE INTO memo VALUES (?, ?, ?, ?, ?, ?)',
+                       (structure, get_family(structure), self.target, params, error, updated))
+            db.execute('UPDATE memo SET params = ?, error = ?, updated = ? WHERE structure = ? AND target = ? AND error > ?',
+                       (params, error, updated, structure, self.target, error))
+
+    def close(self):
+        """Close the database connection (in this process)"""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
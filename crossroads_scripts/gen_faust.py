@@ -6,8 +6,12 @@ processing models in Python and compiling them to Faust
 #%%
 from abc import ABC, abstractmethod
 from plugin_utils import compile_plugin, test_plugin
+import os
 import uuid
+import hashlib
+import itertools
 import numpy as np
+import scipy.signal as signal
 import matplotlib.pyplot as plt
 
 # %%
@@ -15,40 +19,327 @@ def get_uuid():
     """Create a unique ID for every Faust element"""
     return uuid.uuid4().hex[:8]
 
-def trim_elements(elements):
+def get_delay_length(e):
+    """Returns the length of a UnitDelay or Delay element, or None for any other element"""
+    if isinstance(e, UnitDelay):
+        return 1
+    if isinstance(e, Delay):
+        return int(e.length)
+    return None
+
+def get_num_params(e):
+    """Returns the number of parameters of an element"""
+    params = []
+    e.get_params(params, [])
+    return len(params)
+
+def is_linear(e):
+    """Check if an element is linear (and time-invariant)"""
+    return e.get_tf() is not None
+
+def find_gain(chain, reverse=False):
     """
-    Trim unneeded and unnecessary elements from model
+    Returns the index of the first Gain in a chain that is preceded
+    (or followed, if `reverse` is True) only by linear elements, or None
     """
-    for idx, e in enumerate(elements):
-        if idx == 0:
+    idxs = range(len(chain) - 1, -1, -1) if reverse else range(len(chain))
+    for i in idxs:
+        if isinstance(chain[i], Gain):
+            return i
+        if not is_linear(chain[i]):
+            return None
+    return None
+
+def trim_identity(chain, idx):
+    """Remove elements that do nothing: zero-length delays, empty feedback, and single-chain splits"""
+    e = chain[idx]
+    if isinstance(e, Delay) and int(e.length) <= 1:
+        return 1, [UnitDelay()] if int(e.length) == 1 else []
+    if isinstance(e, Feedback) and len(e.elements) == 0: # compiled as +~(_*0)
+        return 1, []
+    if isinstance(e, Split) and len(e.elements) == 1:
+        return 1, e.elements[0]
+    return None
+
+def trim_delays(chain, idx):
+    """Concatenate adjacent delays"""
+    if idx + 1 >= len(chain):
+        return None
+    length1, length2 = get_delay_length(chain[idx]), get_delay_length(chain[idx+1])
+    if length1 is None or length2 is None:
+        return None
+    return 2, [Delay(length1 + length2)]
+
+def trim_gains(chain, idx):
+    """Concatenate gains that are separated only by linear elements (which commute with gains)"""
+    if not isinstance(chain[idx], Gain):
+        return None
+    for j in range(idx + 1, len(chain)):
+        if isinstance(chain[j], Gain):
+            return j - idx + 1, [Gain(chain[idx].gain * chain[j].gain)] + chain[idx+1:j]
+        if not is_linear(chain[j]):
+            return None
+    return None
+
+def trim_split_gain(chain, idx):
+    """Fold a gain before (or after) a split into a gain in every chain of the split"""
+    if idx + 1 >= len(chain):
+        return None
+    for gain, split, reverse in [(chain[idx], chain[idx+1], False), (chain[idx+1], chain[idx], True)]:
+        if not isinstance(gain, Gain) or not isinstance(split, Split):
+            continue
+
+        gain_idxs = [find_gain(c, reverse) for c in split.elements]
+        if None in gain_idxs:
             continue
 
-        # concatenate gain elements
-        if isinstance(e, Gain) and isinstance(elements[idx-1], Gain):
-            e.gain *= elements[idx-1].gain
-            elements.pop(idx-1)
+        chains = []
+        for c, i in zip(split.elements, gain_idxs):
+            chains.append(c[:i] + [Gain(gain.gain * c[i].gain)] + c[i+1:])
+        return 2, [Split(chains)]
+    return None
 
-        # concatenate Unit delays
-        elif isinstance(e, UnitDelay) and isinstance(elements[idx-1], UnitDelay):
-            elements.insert(idx+1, Delay(2))
-            elements.pop(idx)
-            elements.pop(idx-1)
-            
-        # concatenate Delays
-        elif isinstance(e, Delay) and isinstance(elements[idx-1], Delay):
-            e.length += elements[idx-1].length
-            elements.pop(idx-1)
-
-        # concatenate Delay -> Unit Delay
-        elif isinstance(e, UnitDelay) and isinstance(elements[idx-1], Delay):
-            elements.insert(idx+1, Delay(elements[idx-1].length+1))
-            elements.pop(idx)
-            elements.pop(idx-1)
-
-        # concatenate UnitDelay -> Delay
-        elif isinstance(e, Delay) and isinstance(elements[idx-1], UnitDelay):
-            e.length += 1
-            elements.pop(idx-1)
+def trim_nested_split(chain, idx):
+    """Flatten chains that contain only a split into the parent split"""
+    e = chain[idx]
+    if not isinstance(e, Split) or not any(len(c) == 1 and isinstance(c[0], Split) for c in e.elements):
+        return None
+
+    chains = []
+    for c in e.elements:
+        chains += c[0].elements if len(c) == 1 and isinstance(c[0], Split) else [c]
+    return 1, [Split(chains)]
+
+def trim_split_common(chain, idx):
+    """
+    Move elements that start (or end) every chain of a split out of the split.
+    Common delays are moved out by the shortest delay length. Other common elements
+    must have no parameters, and common end elements must also be linear.
+    """
+    e = chain[idx]
+    if not isinstance(e, Split) or len(e.elements) < 2 or any(len(c) == 0 for c in e.elements):
+        return None
+
+    for end, before in [(0, True), (-1, False)]:
+        ends = [c[end] for c in e.elements]
+        lengths = [get_delay_length(x) for x in ends]
+        if None not in lengths and min(lengths) > 0:
+            common = Delay(min(lengths))
+            new_ends = [Delay(l - min(lengths)) for l in lengths]
+        elif all(x.get_topology() == ends[0].get_topology() and get_num_params(x) == 0 for x in ends) \
+            and (before or is_linear(ends[0])):
+            common = ends[0]
+            new_ends = [None] * len(ends)
+        else:
+            continue
+
+        chains = []
+        for c, new_end in zip(e.elements, new_ends):
+            new_end = [new_end] if new_end is not None else []
+            chains.append(new_end + c[1:] if before else c[:-1] + new_end)
+        return 1, [common, Split(chains)] if before else [Split(chains), common]
+    return None
+
+# Rewrite rules for a chain of elements, in order of priority (see trim_elements()).
+# Each rule takes (chain, idx), and returns (n, new_elements) to replace the
+# n elements starting at chain[idx] with new_elements, or None if it does not apply.
+# Every rule must keep the output of the chain (with its current parameters) the same.
+TRIM_RULES = [trim_identity, trim_delays, trim_gains, trim_split_gain, trim_nested_split, trim_split_common]
+
+def trim_elements(elements):
+    """
+    Trim unneeded and unnecessary elements from a chain of elements (and
+    recursively from every chain inside it), by applying TRIM_RULES until
+    none of them apply. The chain is modified in place. Returns True if
+    anything was trimmed.
+    """
+    trimmed = False
+    changed = True
+    while changed:
+        changed = False
+        idx = 0
+        while idx < len(elements):
+            for rule in TRIM_RULES:
+                result = rule(elements, idx)
+                if result is not None:
+                    n, new_elements = result
+                    elements[idx:idx+n] = new_elements
+                    changed = True
+                    break
+            else:
+                idx += 1
+
+        # then trim inner chains (which may allow more rules to apply to this chain)
+        for e in elements:
+            if isinstance(e, Split):
+                for chain in e.elements:
+                    changed = trim_elements(chain) or changed
+                e.update_faust()
+            elif isinstance(e, Feedback):
+                changed = trim_elements(e.elements) or changed
+                e.update_faust()
+
+        trimmed = trimmed or changed
+
+    return trimmed
+
+def get_slider(idx, value, bounds):
+    """Faust slider for the parameter at index `idx` of get_params()"""
+    return 'hslider("p{}", {}, {}, {}, 1e-06)'.format(idx, value, bounds[0], bounds[1])
+
+def get_chain_topology(elements):
+    """Returns the topology string of a series chain of elements"""
+    return '[' + ','.join(e.get_topology() for e in elements) + ']'
+
+def get_chain_names(elements):
+    """Returns the names of every element in a chain (see Element.get_names())"""
+    return [name for e in elements for name in e.get_names()]
+
+def get_chain_canonical(elements):
+    """
+    Returns the canonical description of a chain of elements (see Model.get_canonical()).
+    Runs of linear elements commute, so within each run the delays are
+    combined, and the other elements are sorted.
+    """
+    runs = [[]]
+    delays = [0]
+    for e in elements:
+        if not is_linear(e): # nonlinear elements stay in place
+            runs += [[e.get_canonical()], []]
+            delays += [0, 0]
+        elif get_delay_length(e) is not None:
+            delays[-1] += get_delay_length(e)
+        else:
+            runs[-1].append(e.get_canonical())
+
+    descriptions = []
+    for run, delay in zip(runs, delays):
+        descriptions += sorted(run + (['Delay({})'.format(delay)] if delay > 0 else []))
+    return '[' + ','.join(descriptions) + ']'
+
+def process_chain(elements, x):
+    """Process a block of audio through a series chain of elements"""
+    for e in elements:
+        x = e.process(x)
+    return x
+
+def process_chain_jvp(elements, x, dx, idx):
+    """Process a chain of elements along with its parameter derivatives (see Element.process_jvp())"""
+    for e in elements:
+        x, dx, idx = e.process_jvp(x, dx, idx)
+    return x, dx, idx
+
+def chain_has_gradient(elements):
+    """Check if every element in a chain supports Element.process_jvp()"""
+    return all(e.has_gradient() for e in elements)
+
+def chain_is_feedforward(elements):
+    """Check if a chain of elements contains no feedback"""
+    return all(e.is_feedforward() for e in elements)
+
+def get_chain_param_degree(elements):
+    """
+    Returns the largest number of parameters multiplied together along any path
+    through a chain of elements, or None if the output of the chain is not a
+    polynomial in its parameters (see Element.get_param_degree())
+    """
+    degree = 0
+    for e in elements:
+        e_degree = e.get_param_degree()
+        if e_degree is None:
+            return None
+        degree += e_degree
+    return degree
+
+def reset_chain(elements):
+    """Clear the processing state of a chain of elements"""
+    for e in elements:
+        e.reset()
+
+def get_chain_tf(elements):
+    """
+    Returns the transfer function (b, a) of a series chain of
+    elements, or None if the chain contains a nonlinear element
+    """
+    b = np.array([1.0])
+    a = np.array([1.0])
+    for e in elements:
+        tf = e.get_tf()
+        if tf is None:
+            return None
+        b = poly_mul(b, tf[0])
+        a = poly_mul(a, tf[1])
+    return b, a
+
+# Polynomials in z^-1 are arrays of coefficients along the first axis. When the
+# parameters are batched (see Model.process_batch()), the coefficients have a
+# last axis for the population, so the polynomial functions broadcast over it.
+
+def poly_batch(p):
+    """Polynomial coefficients as a 2D array, with a last axis for the population (of length 1 if not batched)"""
+    p = np.asarray(p, dtype=float)
+    return p.reshape(len(p), -1)
+
+def poly_add(p1, p2):
+    """Add two polynomials in z^-1 of (possibly) different lengths"""
+    if np.ndim(p1) > 1 or np.ndim(p2) > 1:
+        p1, p2 = poly_batch(p1), poly_batch(p2)
+
+    result = np.zeros((max(len(p1), len(p2)),) + np.broadcast_shapes(np.shape(p1)[1:], np.shape(p2)[1:]))
+    result[:len(p1)] += p1
+    result[:len(p2)] += p2
+    return result
+
+def poly_mul(p1, p2):
+    """Multiply two polynomials in z^-1"""
+    if np.ndim(p1) <= 1 and np.ndim(p2) <= 1:
+        return np.convolve(p1, p2)
+
+    p1, p2 = poly_batch(p1), poly_batch(p2)
+    result = np.zeros((len(p1) + len(p2) - 1, max(p1.shape[1], p2.shape[1])))
+    for i, c in enumerate(p1):
+        result[i:i+len(p2)] += c * p2
+    return result
+
+def filter_signal(b, a, x, state):
+    """
+    Filter a block of audio by the transfer function (b, a), continuing from
+    (and returning) the filter state. With batched coefficients (see poly_batch()),
+    the last axis of the audio is filtered one column (candidate) at a time.
+    """
+    n_state = max(len(a), len(b)) - 1
+    shape = np.broadcast_shapes(np.shape(x)[1:], np.shape(b)[1:], np.shape(a)[1:])
+    if state is None or np.shape(state) != (n_state,) + shape:
+        state = np.zeros((n_state,) + shape)
+
+    if np.ndim(b) <= 1 and np.ndim(a) <= 1:
+        return signal.lfilter(b, a, x, axis=0, zi=state)
+
+    x = np.broadcast_to(x, (len(x),) + shape)
+    b = np.broadcast_to(poly_batch(b), (len(b), shape[-1]))
+    a = np.broadcast_to(poly_batch(a), (len(a), shape[-1]))
+    y = np.zeros((shape[-1], len(x)) + shape[:-1]) # one contiguous signal per candidate
+    state = np.array(state)
+    for n in range(shape[-1]):
+        y[n], state[...,n] = signal.lfilter(b[:,n], a[:,n], np.ascontiguousarray(x[...,n]), axis=0, zi=state[...,n])
+    return np.moveaxis(y, 0, -1), state
+
+def delay_signal(x, state, length):
+    """
+    Delay a block of audio by an integer number of samples,
+    using (and returning) the samples left over from the previous block
+    """
+    if state is None or np.shape(state)[1:] != np.shape(x)[1:]:
+        state = np.zeros((length,) + np.shape(x)[1:])
+
+    buffer = np.concatenate((state, x))
+    return buffer[:len(x)], buffer[len(x):]
+
+def shift_signal(x, length):
+    """Delay a signal by an integer number of samples, starting from silence"""
+    if length == 0:
+        return x
+    return np.concatenate((np.zeros((length,) + np.shape(x)[1:]), x[:len(x)-length]))[:len(x)]
 
 #%%
 class Model:
@@ -57,15 +348,21 @@ class Model:
         self.elements = []
         self.name = name
 
-    def write_to_file(self, file):
-        """Compile this signal processing model to a Faust script"""
-        file = open('faust_scripts/'+file, 'w')
+    def write_to_file(self, file, parametric=False, directory='faust_scripts'):
+        """
+        Compile this signal processing model to a Faust script in `directory`.
+        If `parametric` is True, every tunable value is written as an `hslider`
+        labelled `p{idx}` (in the order of get_params()) rather than a constant,
+        so that one compiled plugin can be reused for any parameter values.
+        """
+        file = open(os.path.join(directory, file), 'w')
         file.write('import(\"stdfaust.lib\");\n\n')
 
+        slots = itertools.count() if parametric else None
         processors = []
         for e in self.elements:
             processors.append(e.name)
-            file.write(e.get_faust())
+            file.write(e.get_faust(slots))
 
         process_string = '\nprocess = _,_ :'
         for p in processors:
@@ -95,17 +392,39 @@ class Model:
         return True
 
     def trim_model(self):
-        """Trim model by removing unnecessary or unneeded elements from every chain"""
+        """
+        Trim model by removing unnecessary or unneeded elements from every chain
+        (see trim_elements()). The output of the model does not change, but the
+        parameters may (e.g. gains are combined), so call get_params() again after trimming.
+        """
         trim_elements(self.elements)
-        for e in self.elements:
-            if isinstance(e, Split):
-                for chain in e.elements:
-                    trim_elements(chain)
-                e.update_faust()
 
-            elif isinstance(e, Feedback):
-                trim_elements(e.elements)
-                e.update_faust()
+    def get_topology(self):
+        """
+        Returns a canonical description of the model structure, that
+        does not depend on element names or parameter values
+        """
+        return get_chain_topology(self.elements)
+
+    def get_names(self):
+        """
+        Returns the names of every element (depth first), which are the
+        same for models with the same topology up to renaming
+        """
+        return get_chain_names(self.elements)
+
+    def get_canonical(self):
+        """
+        Returns a description of the model structure, that is the same for
+        models that differ only in ways that never change the output (for any
+        parameter values): the order of the chains in a Split, the order of
+        elements within a run of linear elements, and how delays are split up
+        """
+        return get_chain_canonical(self.elements)
+
+    def get_structure_hash(self):
+        """Returns a stable hash of get_canonical() (the same in every process and run)"""
+        return hashlib.sha1(self.get_canonical().encode()).hexdigest()[:16]
 
     def get_params(self):
         """Returns an array of parameters"""
@@ -123,15 +442,143 @@ class Model:
         for e in self.elements:
             idx = e.set_params(params, idx)
 
+    def process(self, x):
+        """
+        Process a block of audio (samples along the first axis) through the model,
+        continuing from the state left by the previous block. Each channel is
+        processed independently, as in the compiled Faust plugin.
+        """
+        return process_chain(self.elements, np.asarray(x, dtype=float))
+
+    def reset(self):
+        """Clear the processing state of the model"""
+        reset_chain(self.elements)
+
+    def process_jvp(self, x):
+        """
+        Process a signal through the model (from a cleared state), and return
+        the output along with its derivatives with respect to each parameter
+        in get_params(), as an array with an extra last axis for the parameters
+        """
+        x = np.asarray(x, dtype=float)
+        params, _ = self.get_params()
+        dx = np.zeros(np.shape(x) + (len(params),))
+
+        y, dy, _ = process_chain_jvp(self.elements, x, dx, 0)
+        return y, dy
+
+    def has_gradient(self):
+        """Check if process_jvp() is supported for this model"""
+        return chain_has_gradient(self.elements)
+
+    def is_feedforward(self):
+        """Check if the model contains no feedback"""
+        return chain_is_feedforward(self.elements)
+
+    def is_linear_in_params(self):
+        """
+        Check if the model output is linear in the parameters from get_params(),
+        i.e. the output is a weighted sum of delayed and filtered copies of the input
+        (such as an FIR filter made of gains in parallel delay chains)
+        """
+        degree = get_chain_param_degree(self.elements)
+        return degree is not None and degree <= 1
+
+    def get_tf(self):
+        """
+        Returns the transfer function (b, a) of the whole model (polynomials in z^-1),
+        or None if the model contains a nonlinear element
+        """
+        return get_chain_tf(self.elements)
+
+    def process_batch(self, x, population):
+        """
+        Process a signal through the model (from a cleared state) for every
+        parameter vector (row) in `population`, and return the outputs with an
+        extra last axis for the population. The models are rendered in one pass,
+        with the parameters broadcast over that axis: feedback loops carry one
+        state per candidate, and IIR filters are run once per candidate
+        (see filter_signal()).
+        """
+        x = np.asarray(x, dtype=float)
+        population = np.asarray(population, dtype=float)
+        params, _ = self.get_params()
+
+        self.set_params(population.T)
+        self.reset()
+        if self.is_feedforward():
+            y = np.broadcast_to(self.process(x[...,np.newaxis]), np.shape(x) + (len(population),))
+        else: # feedback state needs the full population axis from the first sample
+            # (stored one contiguous signal per candidate, see filter_signal())
+            y = self.process(np.moveaxis(np.repeat(x[np.newaxis], len(population), axis=0), 0, -1))
+
+        self.set_params(params)
+        self.reset()
+        return y
+
 class Element(ABC):
     """Base class for signal processing elements"""
     def __init__(self):
         pass
 
     @abstractmethod
-    def get_faust(self):
+    def get_faust(self, slots=None):
+        """
+        Returns the Faust code for this element. If `slots` is given, parameters
+        are written as sliders, numbered by taking the next index from `slots`
+        """
         return ''
 
+    @abstractmethod
+    def process(self, x):
+        """Process a block of audio, with samples along the first axis"""
+        return x
+
+    def reset(self):
+        """Clear any state held between blocks"""
+        pass
+
+    def get_tf(self):
+        """Returns the transfer function (b, a) of the element, or None if nonlinear"""
+        return None
+
+    def get_topology(self):
+        """Returns a description of the element structure, without names or parameter values"""
+        return type(self).__name__
+
+    def get_names(self):
+        """Returns the names of this element and any elements it contains (depth first)"""
+        return [self.name]
+
+    def get_canonical(self):
+        """Returns the canonical description of the element structure (see Model.get_canonical())"""
+        return self.get_topology()
+
+    def process_jvp(self, x, dx, idx):
+        """
+        Process a whole signal (from a cleared state, without changing the state
+        used by process()) along with its derivatives `dx` with respect to every
+        model parameter. `idx` is the index of this element's first parameter.
+        Returns the output, output derivatives, and the index of the next parameter.
+        """
+        return self.process(x), dx, idx
+
+    def has_gradient(self):
+        """Check if process_jvp() is supported for this element"""
+        return True
+
+    def is_feedforward(self):
+        """Check if the element contains no feedback"""
+        return True
+
+    def get_param_degree(self):
+        """
+        Returns the largest number of parameters multiplied together along any path
+        through the element, or None if the output is not a polynomial in the
+        parameters (nonlinear elements, or parameters inside feedback)
+        """
+        return 0 if self.get_tf() is not None and get_num_params(self) == 0 else None
+
     def get_params(self, params, bounds):
         pass
 
@@ -151,9 +598,25 @@ class Gain(Element):
     def __eq__(self, other):
         return self.gain == other.gain
 
-    def get_faust(self):
+    def get_faust(self, slots=None):
+        if slots is not None:
+            return '{} = _*{};\n'.format(self.name, get_slider(next(slots), self.gain, (-10, 10)))
         return '{} = _*{};\n'.format(self.name, self.gain)
 
+    def process(self, x):
+        return x * self.gain
+
+    def process_jvp(self, x, dx, idx):
+        dy = dx * self.gain
+        dy[...,idx] += x
+        return x * self.gain, dy, idx + 1
+
+    def get_tf(self):
+        return np.array([self.gain], dtype=float), np.array([1.0])
+
+    def get_param_degree(self):
+        return 1
+
     def get_params(self, params, bounds):
         params.append(self.gain)
         bounds.append((-10, 10))
@@ -167,6 +630,7 @@ class UnitDelay(Element):
     def __init__(self):
         id = get_uuid()
         self.name = 'unit_delay_' + id
+        self.state = None
 
     def __str__(self):
         return 'UnitDelay'
@@ -174,15 +638,29 @@ class UnitDelay(Element):
     def __eq__(self, other):
         return True
 
-    def get_faust(self):
+    def get_faust(self, slots=None):
         return '{} = @(1);\n'.format(self.name)
 
+    def process(self, x):
+        y, self.state = delay_signal(x, self.state, 1)
+        return y
+
+    def process_jvp(self, x, dx, idx):
+        return shift_signal(x, 1), shift_signal(dx, 1), idx
+
+    def reset(self):
+        self.state = None
+
+    def get_tf(self):
+        return np.array([0.0, 1.0]), np.array([1.0])
+
 class Delay(Element):
     """Multi-sample delay element"""
     def __init__(self, length=0):
         id = get_uuid()
         self.name = 'delay_' + id
         self.length = length
+        self.state = None
 
     def __str__(self):
         return 'Delay({})'.format(self.length)
@@ -190,9 +668,30 @@ class Delay(Element):
     def __eq__(self, other):
         return self.length == other.length
 
-    def get_faust(self):
+    def get_faust(self, slots=None):
         return '{} = @({});\n'.format(self.name, int(self.length))
 
+    def get_topology(self):
+        return 'Delay({})'.format(int(self.length))
+
+    def process(self, x):
+        if int(self.length) == 0:
+            return x
+
+        y, self.state = delay_signal(x, self.state, int(self.length))
+        return y
+
+    def process_jvp(self, x, dx, idx):
+        return shift_signal(x, int(self.length)), shift_signal(dx, int(self.length)), idx
+
+    def reset(self):
+        self.state = None
+
+    def get_tf(self):
+        b = np.zeros(int(self.length) + 1)
+        b[-1] = 1.0
+        return b, np.array([1.0])
+
 class CubicNL(Element):
     """Cubic soft-clipping element"""
     def __init__(self):
@@ -205,9 +704,17 @@ class CubicNL(Element):
     def __eq__(self, other):
         return True
 
-    def get_faust(self):
+    def get_faust(self, slots=None):
         return '{} = min(1) : max(-1) : cubic with{{ cubic(x) = x - x*x*x/3; }};\n'.format(self.name)
 
+    def process(self, x):
+        x = np.clip(x, -1, 1)
+        return x - x*x*x/3
+
+    def process_jvp(self, x, dx, idx):
+        x = np.clip(x, -1, 1)
+        return x - x*x*x/3, dx * (1 - x*x)[...,np.newaxis], idx
+
 class Split(Element):
     """Element that contains a parallel chains of elements"""
     def __init__(self, elements):
@@ -264,15 +771,64 @@ class Split(Element):
         
         return True
 
-    def get_faust(self):
+    def get_faust(self, slots=None):
         string = ''
         for chain in self.elements:
             for e in chain:
-                string += e.get_faust()
+                string += e.get_faust(slots)
 
         string += '{} = {};\n\n'.format(self.name, self.faust)
         return string
 
+    def process(self, x):
+        y = np.zeros_like(x)
+        for chain in self.elements:
+            y = y + process_chain(chain, x)
+        return y
+
+    def reset(self):
+        for chain in self.elements:
+            reset_chain(chain)
+
+    def process_jvp(self, x, dx, idx):
+        y = np.zeros_like(x)
+        dy = np.zeros_like(dx)
+        for chain in self.elements:
+            y_chain, dy_chain, idx = process_chain_jvp(chain, x, dx, idx)
+            y = y + y_chain
+            dy = dy + dy_chain
+        return y, dy, idx
+
+    def has_gradient(self):
+        return all(chain_has_gradient(chain) for chain in self.elements)
+
+    def is_feedforward(self):
+        return all(chain_is_feedforward(chain) for chain in self.elements)
+
+    def get_tf(self):
+        b = np.array([0.0])
+        a = np.array([1.0])
+        for chain in self.elements:
+            tf = get_chain_tf(chain)
+            if tf is None:
+                return None
+            b = poly_add(poly_mul(b, tf[1]), poly_mul(tf[0], a))
+            a = poly_mul(a, tf[1])
+        return b, a
+
+    def get_topology(self):
+        return 'Split(' + ','.join(get_chain_topology(chain) for chain in self.elements) + ')'
+
+    def get_names(self):
+        return [self.name] + [name for chain in self.elements for name in get_chain_names(chain)]
+
+    def get_canonical(self):
+        return 'Split(' + ','.join(sorted(get_chain_canonical(chain) for chain in self.elements)) + ')'
+
+    def get_param_degree(self):
+        degrees = [get_chain_param_degree(chain) for chain in self.elements]
+        return None if None in degrees else max(degrees, default=0)
+
     def get_params(self, params, bounds):
         for chain in self.elements:
             for e in chain:
@@ -292,15 +848,51 @@ class FB2(Element):
 
         self.pole_mag = 0.5 # 0-1
         self.pole_angle = 0.5 # 0-1
-    
-    def get_faust(self):
-        root1 = self.pole_mag * np.exp(+1j * self.pole_angle)
-        root2 = self.pole_mag * np.exp(-1j * self.pole_angle)
-        poly = np.poly((root1, root2))
+        self.state = None
+
+    def get_poly(self):
+        """Returns the feedback polynomial [1, a1, a2] for the current poles"""
+        # (z - mag*e^(j*angle)) * (z - mag*e^(-j*angle))
+        mag, angle = np.asarray(self.pole_mag, dtype=float), np.asarray(self.pole_angle, dtype=float)
+        return np.array([np.ones_like(mag), -2*mag*np.cos(angle), mag*mag])
+
+    def get_faust(self, slots=None):
+        if slots is not None:
+            mag = get_slider(next(slots), self.pole_mag, (0, 1))
+            angle = get_slider(next(slots), self.pole_angle, (0, 1))
+            string = '{} = +~(_ <: (_*a1, _*a2) : (_, @(1)) :> _) with {{ mag = {}; angle = {}; a1 = 2*mag*cos(angle); a2 = -mag*mag; }};\n'.format(self.name, mag, angle)
+            return string
+
+        poly = self.get_poly()
 
         string = '{} = +~(_ <: (_*{}, _*{}) : (_, @(1)) :> _);\n'.format(self.name, -poly[1], -poly[2])
         return string
 
+    def process(self, x):
+        y, self.state = filter_signal(np.array([1.0]), self.get_poly(), x, self.state)
+        return y
+
+    def reset(self):
+        self.state = None
+
+    def process_jvp(self, x, dx, idx):
+        a = self.get_poly()
+        y = signal.lfilter([1.0], a, x, axis=0)
+
+        # y[n] = x[n] + a1*y[n-1] + a2*y[n-2], with a1 = 2*mag*cos(angle), a2 = -mag^2
+        y1 = shift_signal(y, 1)
+        y2 = shift_signal(y, 2)
+        dx = np.array(dx)
+        dx[...,idx] += 2*np.cos(self.pole_angle) * y1 - 2*self.pole_mag * y2
+        dx[...,idx+1] += -2*self.pole_mag*np.sin(self.pole_angle) * y1
+        return y, signal.lfilter([1.0], a, dx, axis=0), idx + 2
+
+    def get_tf(self):
+        return np.array([1.0]), self.get_poly()
+
+    def is_feedforward(self):
+        return False
+
     def get_params(self, params, bounds):
         params.append(self.pole_mag)
         bounds.append((0, 1))
@@ -319,6 +911,7 @@ class Feedback(Element):
         id = get_uuid()
         self.name = 'fb_' + id
         self.elements = elements
+        self.state = None
         self.update_faust()
 
     def update_faust(self):
@@ -351,14 +944,75 @@ class Feedback(Element):
         
         return True
 
-    def get_faust(self):
+    def get_faust(self, slots=None):
         string = ''
         for e in self.elements:
-            string += e.get_faust()
+            string += e.get_faust(slots)
 
         string += '{} = {};\n\n'.format(self.name, self.faust)
         return string
 
+    def process(self, x):
+        tf = self.get_tf()
+        if tf is not None: # linear feedback path: run as an IIR filter
+            b, a = tf
+            if max(len(a), len(b)) == 1:
+                return x * b[0] / a[0]
+
+            y, self.state = filter_signal(b, a, x, self.state)
+            return y
+
+        # nonlinear feedback path: run the loop one sample at a time
+        if self.state is None or np.shape(self.state) != np.shape(x)[1:]:
+            self.state = np.zeros(np.shape(x)[1:])
+
+        y = np.zeros_like(x)
+        for n in range(len(x)):
+            y[n] = x[n] + self.state
+            self.state = process_chain(self.elements, y[n:n+1])[0]
+        return y
+
+    def reset(self):
+        self.state = None
+        reset_chain(self.elements)
+
+    def process_jvp(self, x, dx, idx):
+        b, a = self.get_tf()
+        y = signal.lfilter(b, a, x, axis=0)
+
+        # y = x + z^-1 * C(y)  =>  dy = H(z) * (dx + z^-1 * dC/dp(y))
+        # since the feedback chain C is linear in its input
+        _, dc, idx = process_chain_jvp(self.elements, y, np.zeros_like(dx), idx)
+        dy = signal.lfilter(b, a, dx + shift_signal(dc, 1), axis=0)
+        return y, dy, idx
+
+    def has_gradient(self):
+        return self.get_tf() is not None and chain_has_gradient(self.elements)
+
+    def is_feedforward(self):
+        return False
+
+    def get_tf(self):
+        # y = x + z^-1 * H_fb(z) * y  =>  H(z) = A_fb / (A_fb - z^-1 * B_fb)
+        if len(self.elements) == 0: # empty feedback path is compiled as (_*0)
+            return np.array([1.0]), np.array([1.0])
+
+        tf = get_chain_tf(self.elements)
+        if tf is None:
+            return None
+
+        b_fb, a_fb = tf
+        return a_fb, poly_add(a_fb, -poly_mul([0.0, 1.0], b_fb))
+
+    def get_topology(self):
+        return 'Feedback(' + get_chain_topology(self.elements) + ')'
+
+    def get_names(self):
+        return [self.name] + get_chain_names(self.elements)
+
+    def get_canonical(self):
+        return 'Feedback(' + get_chain_canonical(self.elements) + ')'
+
     def get_params(self, params, bounds):
         for e in self.elements:
             e.get_params(params, bounds)
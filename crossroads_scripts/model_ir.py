@@ -0,0 +1,114 @@
+"""
+Compact array-backed representation of models, for storing,
+copying and sending large populations of models. Code generation
+and rendering still work on Model element trees (see to_model()).
+"""
+
+import numpy as np
+from gen_faust import Model,Gain,UnitDelay,Delay,CubicNL,Split,FB2,Feedback
+
+# Node type codes (index in this list). A CHAIN node is a series chain of elements:
+# the model itself, each chain of a Split, and the chain of a Feedback.
+CHAIN = 0
+NODE_TYPES = [None, Gain, UnitDelay, Delay, CubicNL, Split, FB2, Feedback]
+
+class ModelIR:
+    """
+    Flat representation of a model: the nodes of the element tree are stored
+    in the same (depth-first) order as Model.get_params() visits them, as arrays of:
+     - `types`: node type codes (see NODE_TYPES)
+     - `parents`: index of the parent node (-1 for the model chain)
+     - `lengths`: delay lengths (0 for other nodes)
+    along with the parameters of every element in one contiguous array `params`
+    (with bounds in `lower` and `upper`), in the same order as Model.get_params().
+
+    Convert with ModelIR.from_model() and to_model(). ModelIRs are cheap to copy
+    and pickle, and get_params()/set_params() do not traverse the tree, so they are
+    used to send models to and from workers, in checkpoints, and to copy elements.
+    """
+    def __init__(self, types, parents, lengths, params, lower, upper):
+        self.types = types
+        self.parents = parents
+        self.lengths = lengths
+        self.params = params
+        self.lower = lower
+        self.upper = upper
+
+    @classmethod
+    def from_model(cls, model):
+        """Create the flat representation of a model (raises a TypeError for unknown element types)"""
+        types, parents, lengths, params, bounds = [], [], [], [], []
+
+        def add_chain(elements, parent):
+            chain = len(types)
+            types.append(CHAIN)
+            parents.append(parent)
+            lengths.append(0)
+            for e in elements:
+                if type(e) not in NODE_TYPES:
+                    raise TypeError('ModelIR does not support {} elements (see NODE_TYPES)'.format(type(e).__name__))
+                idx = len(types)
+                types.append(NODE_TYPES.index(type(e)))
+                parents.append(chain)
+                lengths.append(int(e.length) if isinstance(e, Delay) else 0)
+                if isinstance(e, Split):
+                    for c in e.elements:
+                        add_chain(c, idx)
+                elif isinstance(e, Feedback):
+                    add_chain(e.elements, idx)
+                else:
+                    e.get_params(params, bounds)
+
+        add_chain(model.elements, -1)
+        bounds = np.array(bounds, dtype=float).reshape(-1, 2)
+        return cls(np.array(types, dtype=np.int8), np.array(parents, dtype=np.int32), np.array(lengths, dtype=np.int32),
+                   np.array(params, dtype=float), bounds[:,0].copy(), bounds[:,1].copy())
+
+    def to_model(self, name=None):
+        """Create a Model (with new elements) from the flat representation"""
+        model = Model(name)
+        nodes = [None] * len(self.types)
+        params = self.params.tolist()
+        param_idx = 0
+        for i, (node_type, parent) in enumerate(zip(self.types, self.parents)):
+            if node_type == CHAIN:
+                nodes[i] = []
+                if parent < 0:
+                    model.elements = nodes[i]
+                elif isinstance(nodes[parent], Split):
+                    nodes[parent].elements.append(nodes[i])
+                else:
+                    nodes[parent].elements = nodes[i]
+                continue
+
+            element_type = NODE_TYPES[node_type]
+            if element_type in (Split, Feedback):
+                e = element_type([])
+            elif element_type is Delay:
+                e = Delay(int(self.lengths[i]))
+            else:
+                e = element_type()
+                param_idx = e.set_params(params, param_idx)
+            nodes[i] = e
+            nodes[parent].append(e)
+
+        for e in nodes:
+            if isinstance(e, (Split, Feedback)):
+                e.update_faust()
+        return model
+
+    def __len__(self):
+        """Number of nodes"""
+        return len(self.types)
+
+    def get_params(self):
+        """Returns the parameters (a view, not a copy), and their bounds as an array of (lower, upper) rows"""
+        return self.params, np.stack((self.lower, self.upper), axis=1)
+
+    def set_params(self, params):
+        """Set the parameters (in the same order as get_params())"""
+        self.params[:] = params
+
+    def copy(self):
+        """Returns a copy (with its own parameters)"""
+        return ModelIR(self.types, self.parents, self.lengths, self.params.copy(), self.lower, self.upper)
@@ -4,118 +4,445 @@ model to recreate the target audio
 """
 
 import numpy as np
-from scipy.io import wavfile
+import scipy.signal as signal
 from gen_faust import Model
-from plugin_utils import compile_plugin, test_plugin, calc_error
+from plugin_utils import compile_model, test_plugin, read_wav, load_wav, get_target_loss, remove_files
+from plugin_utils import get_wav_block_pairs, StreamingLoss, calc_error_streaming
+from faust_server import FaustServer
+import compile_cache
+from toolchain import run_tool
 from tqdm import tqdm
 import os
 from sys import platform
-from scipy.optimize import minimize
+from scipy.optimize import minimize, lsq_linear
 
 # If you don't want to use libsndfile, set this to False
 USING_LIBSNDFILE=True
 
-def optimize_model(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
+# To render and score audio in blocks of this many samples (so that memory
+# use does not grow with the length of the audio), set this to e.g. 2**16
+STREAMING_BLOCK_SIZE=None
+
+# Optimizations that are given a `prune_error` (see optimize_model()) are stopped
+# early once they are unlikely to reach it: after PRUNE_MIN_ITERS iterations, the
+# error is extrapolated over the remaining iterations, at the (geometric) rate of
+# improvement over the last PRUNE_WINDOW iterations
+PRUNE_MIN_ITERS=5
+PRUNE_WINDOW=3
+
+# Least squares parameters of models that are linear in their parameters (see
+# optimize_model()) minimize the squared error only, so if they do not reach the
+# tolerance they are polished with at most this many iterations of the full loss
+LINEAR_POLISH_MAXITER=5
+
+# Populations are rendered by the Python backend in batches (see get_errors_for_population())
+# of as many parameter vectors as fit in about this much memory (bytes)
+BATCH_MEMORY=2**28
+
+# Linear models are rendered by the Python backend with a single IIR filter, using
+# the transfer function of the whole model (see render_model_python()), if it has at
+# most this many coefficients. Longer transfer functions (e.g. from long delays) are
+# faster to render element by element.
+TF_MAX_LENGTH=64
+
+def using_sndfile():
+    """Check if faust2sndfile executables can be used on this platform"""
+    return platform != "win32" and USING_LIBSNDFILE
+
+class PruneOptimization(Exception):
+    """Raised by OptimizationMonitor.callback() to stop an optimization that cannot reach the prune error"""
+
+class OptimizationMonitor:
+    """
+    Wraps an error function for scipy.optimize.minimize(), keeping track of
+    the best parameters (and error) evaluated so far. Pass callback() as the
+    minimize() callback to stop early (with PruneOptimization) when the
+    optimization is unlikely to reach `prune_error` within `maxiter` iterations.
+    """
+    def __init__(self, error_func, prune_error=None, maxiter=40):
+        self.error_func = error_func
+        self.prune_error = prune_error
+        self.maxiter = maxiter
+        self.best_params = None
+        self.best_error = np.inf
+        self.history = [] # best error after each iteration
+        self.nfev = 0
+
+    def __call__(self, params, *args):
+        self.nfev += 1
+        result = self.error_func(params, *args)
+        error = result[0] if isinstance(result, tuple) else result # error functions may also return a gradient
+        if error < self.best_error:
+            self.best_error = error
+            self.best_params = np.copy(params)
+        return result
+
+    def callback(self, xk):
+        """Called after every iteration"""
+        self.history.append(self.best_error)
+        if self.prune_error is None or len(self.history) < PRUNE_MIN_ITERS or self.best_error <= self.prune_error:
+            return
+
+        prev_error = self.history[-1 - PRUNE_WINDOW]
+        rate = self.best_error / prev_error if np.isfinite(prev_error) and prev_error > 0 else 1.0
+        if self.best_error * rate ** ((self.maxiter - len(self.history)) / PRUNE_WINDOW) > self.prune_error:
+            raise PruneOptimization()
+
+def optimize_model(model, name, in_wav, out_wav, des_wav, tol=1.0e-5, backend='faust', directory=None, stats=None, prune_error=None):
     """
-    Estimate parameters for a model using L-BFGS-B algorithm
+    Estimate parameters for a model using L-BFGS-B algorithm.
+    With `backend='parametric'`, the model is compiled once with parameter
+    sliders, and the same executable is reused for every iteration.
+    With `backend='server'`, that executable is also kept running for the
+    whole optimization (see faust_server.FaustServer).
+    With `backend='python'`, exact gradients are used when the model supports them
+    (unless streaming, see STREAMING_BLOCK_SIZE). Compiled files are kept in `directory` if given (see get_sndfile_paths()).
+    If `stats` is a dict, the number of iterations and error evaluations are recorded in it.
+
+    If `prune_error` is given, the optimization is stopped early when it is unlikely
+    to reach that error (see OptimizationMonitor), and the best parameters so far are
+    returned. Then `stats['pruned']` is True, and `stats['pruned_error']` is the best error so far.
+
+    Models that are linear in their parameters (see Model.is_linear_in_params()) are
+    solved directly by least squares (see get_linear_params()), unless streaming, and
+    `stats['linear']` is True. If that does not reach `tol` (e.g. the target is not exactly
+    reachable), the least squares parameters are only polished, with at most
+    LINEAR_POLISH_MAXITER iterations, and `stats['linear_polish']` is True instead.
     """
     params, bounds = model.get_params()
+    if stats is not None:
+        stats.update({'nit': 0, 'nfev': 0, 'pruned': False, 'linear': False, 'linear_polish': False})
     if params == []:
         return params
 
-    result = minimize(get_error_for_model, params, args=(model,name,in_wav,out_wav,des_wav), tol=tol,
-                      bounds=bounds, options={'maxiter': 40, 'eps': 1e-06, 'ftol': 1e-11, 'iprint': 1})
+    options = {'maxiter': 40, 'eps': 1e-06, 'ftol': 1e-11, 'iprint': 1}
+    if model.is_linear_in_params() and STREAMING_BLOCK_SIZE is None:
+        params = get_linear_params(model, in_wav, des_wav)
+        error = get_error_for_model_python(params, model, in_wav, des_wav)
+        if error <= tol:
+            if stats is not None:
+                stats.update({'nfev': 1, 'linear': True})
+            return params
+
+        # fall through to a short polish of the full loss
+        if stats is not None:
+            stats['linear_polish'] = True
+        options['maxiter'] = LINEAR_POLISH_MAXITER
+
+    if backend in ('parametric', 'server'):
+        if not using_sndfile():
+            backend = 'faust'
+        else:
+            compile_sndfile(model, name, parametric=True, directory=directory)
+
+    try:
+        if backend == 'server':
+            with FaustServer(name, in_wav, directory) as server:
+                monitor = OptimizationMonitor(get_error_for_model_server, prune_error, options['maxiter'])
+                result = minimize(monitor, params, args=(model,server,des_wav), tol=tol,
+                                  bounds=bounds, options=options, callback=monitor.callback)
+        elif backend == 'python' and model.has_gradient() and STREAMING_BLOCK_SIZE is None:
+            monitor = OptimizationMonitor(get_error_and_grad_for_model_python, prune_error, options['maxiter'])
+            result = minimize(monitor, params, args=(model,in_wav,des_wav), tol=tol,
+                              jac=True, bounds=bounds, options=options, callback=monitor.callback)
+        else:
+            monitor = OptimizationMonitor(get_error_for_model, prune_error, options['maxiter'])
+            result = minimize(monitor, params, args=(model,name,in_wav,out_wav,des_wav,backend,directory), tol=tol,
+                              bounds=bounds, options=options, callback=monitor.callback)
+    except PruneOptimization:
+        print('Pruned after {} iterations, error: {}'.format(len(monitor.history), monitor.best_error))
+        if stats is not None:
+            stats.update({'nit': len(monitor.history), 'nfev': monitor.nfev, 'pruned': True, 'pruned_error': float(monitor.best_error)})
+        return monitor.best_params
+    finally:
+        if backend in ('parametric', 'server'):
+            remove_files(get_sndfile_paths(name, directory)[1])
+
+    if stats is not None:
+        stats.update({'nit': int(result.nit), 'nfev': int(result.nfev)})
+
+    return result.x
+
+def get_linear_params(model, in_wav, des_wav):
+    """
+    Least squares parameters (within the parameter bounds) for a model that is linear
+    in its parameters (see Model.is_linear_in_params()). The model output is
+    y0 + dy @ params, where the columns of dy (delayed and filtered copies of the dry
+    audio) come from Model.process_jvp(), so this takes one render and one solve.
+    """
+    params, bounds = model.get_params()
+    _, x = load_wav(in_wav)
+    _, y_des = load_wav(des_wav)
 
+    y, dy = model.process_jvp(x)
+    y0 = y - dy @ np.array(params, dtype=float)
+    bounds = np.array(bounds, dtype=float)
+    result = lsq_linear(dy.reshape(-1, len(params)), (y_des - y0).ravel(), bounds=(bounds[:,0], bounds[:,1]))
     return result.x
 
-def get_error_for_model(params, model, name, in_wav, out_wav, des_wav):
+def get_sndfile_paths(name, directory=None):
+    """
+    Locations of the faust script directory and faust2sndfile executable for a model.
+    By default these are `faust_scripts/` and `./{name}-sndfile`,
+    otherwise both are kept in the given (scratch) directory.
+    """
+    if directory is None:
+        return 'faust_scripts', './' + name + '-sndfile'
+    return directory, os.path.join(directory, name + '-sndfile')
+
+def compile_sndfile(model, name, parametric=False, directory=None):
+    """
+    Compile a model to a faust2sndfile executable `./{name}-sndfile`.
+    If `parametric` is True, the executable takes the model parameters
+    as command line arguments (see Model.write_to_file()).
+    Previously compiled parametric executables are re-used from the compile cache
+    (executables with the parameter values compiled in are almost never re-used,
+    so they are not cached). If `directory` is given, the executable is compiled there instead.
+    """
+    script_dir, sndfile = get_sndfile_paths(name, directory)
+    model.write_to_file(name + '.dsp', parametric=parametric, directory=script_dir)
+
+    key = compile_cache.get_model_key(model, 'sndfile', parametric)
+    artifacts = {'plugin-sndfile': sndfile}
+    if parametric and compile_cache.fetch(key, artifacts):
+        return
+
+    try:
+        run_tool('faust', ['faust', '-i', '-light', '-a', 'crossroads_scripts/faust_mysndfile.cpp',
+                           os.path.join(script_dir, name + '.dsp'), '-o', sndfile + '.cpp'])
+        run_tool('g++', ['g++', '-std=c++11', sndfile + '.cpp', '-o', sndfile, '-lsndfile']) # ~0.5 seconds/iter
+    finally:
+        remove_files(sndfile + '.cpp')
+
+    if parametric:
+        compile_cache.store(key, artifacts)
+
+def get_error_for_model(params, model, name, in_wav, out_wav, des_wav, backend='faust', directory=None):
     """
     Calculate error for a model and parameters, by compiling to a faust2sndfile executable
-    plugin, running audio through, and comparing the output audio with the desired
+    plugin, running audio through, and comparing the output audio with the desired.
+    With `backend='python'` the model is instead rendered in-process with NumPy/SciPy.
+    Compiled files are kept in `directory` if given (see get_sndfile_paths()).
     """
+    if backend == 'python':
+        return get_error_for_model_python(params, model, in_wav, des_wav)
+
+    if backend == 'parametric':
+        return get_error_for_model_parametric(params, model, name, in_wav, out_wav, des_wav, directory)
+
     # fallback to VST version if libsndfile not available
-    if platform == "win32" or USING_LIBSNDFILE == False:
-        return get_error_for_model_vst(params, model, name, in_wav, out_wav, des_wav)
+    if not using_sndfile():
+        return get_error_for_model_vst(params, model, name, in_wav, out_wav, des_wav, directory)
 
     model.set_params(params)
-    model.write_to_file(name + '.dsp')
 
     # compile faust script to a faust2sndfile executable
-    os.system('faust -i -light -a crossroads_scripts/faust_mysndfile.cpp faust_scripts/{0}.dsp -o {0}-sndfile.cpp'.format(name))
-    os.system('g++ -std=c++11 {0}-sndfile.cpp -o {0}-sndfile -lsndfile'.format(name)) # ~0.5 seconds/iter
-    os.system('./{}-sndfile {} {}'.format(name, in_wav, out_wav)) # ~0.04 seconds/iter
-    os.system('rm {0}-sndfile; rm {0}-sndfile.cpp'.format(name)) # ~0.01 seconds/iter
+    compile_sndfile(model, name, directory=directory)
+    sndfile = get_sndfile_paths(name, directory)[1]
+    try:
+        run_tool('render', [sndfile, in_wav, out_wav]) # ~0.04 seconds/iter
+    finally:
+        remove_files(sndfile) # ~0.01 seconds/iter
 
-    # read wav files
-    # ~0.02 seconds/iter
-    fs, y = wavfile.read(des_wav)
-    fs, y_test = wavfile.read(out_wav)
+    # read output wav file
+    return get_error_for_wav(out_wav, des_wav)
+
+def get_error_for_model_parametric(params, model, name, in_wav, out_wav, des_wav, directory=None):
+    """
+    Calculate error for a model and parameters, using a faust2sndfile executable
+    that has already been compiled with parameter sliders (see compile_sndfile())
+    """
+    model.set_params(params)
+
+    param_args = ['{:.17g}'.format(p) for p in params]
+    sndfile = get_sndfile_paths(name, directory)[1]
+    run_tool('render', [sndfile, in_wav, out_wav] + param_args) # ~0.04 seconds/iter
+
+    return get_error_for_wav(out_wav, des_wav)
+
+def get_error_for_model_server(params, model, server, des_wav):
+    """
+    Calculate error for a model and parameters, using a running Faust server
+    """
+    model.set_params(params)
+
+    y_test = np.clip(server.render(params), -1, 1) # compiled plugin output is fixed-point
+
+    return get_target_loss(des_wav)(y_test)
+
+def get_error_for_model_python(params, model, in_wav, des_wav):
+    """
+    Calculate error for a model and parameters, by rendering the dry audio
+    through the model in Python, and comparing the output audio with the desired
+    """
+    model.set_params(params)
+    model.reset()
+
+    if STREAMING_BLOCK_SIZE is not None:
+        return get_error_for_model_python_streaming(model, in_wav, des_wav, STREAMING_BLOCK_SIZE)
 
-    # normalize for wav files
-    y = y / 2**15 if np.max(np.abs(y)) > 10 else y
-    y_test = y_test / 2**15 if np.max(np.abs(y_test)) > 10 else y_test
+    fs, x = load_wav(in_wav)
+    y_test = np.clip(render_model_python(model, x), -1, 1) # compiled plugin output is fixed-point
 
-    return calc_error(y, y_test, fs) # ~0.06 seconds/iter
+    return get_target_loss(des_wav)(y_test)
+
+def render_model_python(model, x):
+    """
+    Render a signal through a model (from a cleared state). Linear models are
+    rendered in one pass, by filtering with the transfer function of the whole
+    model (see Model.get_tf() and TF_MAX_LENGTH), others element by element.
+    """
+    tf = model.get_tf()
+    if tf is not None and len(tf[0]) + len(tf[1]) <= TF_MAX_LENGTH:
+        b, a = tf
+        if len(b) == 1 and len(a) == 1:
+            return x * (b[0] / a[0])
+        return signal.lfilter(b, a, x, axis=0)
 
+    model.reset()
+    return model.process(x)
 
-def get_error_for_model_vst(params, model, name, in_wav, out_wav, des_wav):
+def get_error_for_model_python_streaming(model, in_wav, des_wav, block_size):
+    """
+    Calculate error for a model by rendering and scoring the audio one block at
+    a time. The model state is carried across blocks, so the result is the same
+    as rendering the whole signal at once.
+    """
+    loss = StreamingLoss()
+    for x, des in get_wav_block_pairs(in_wav, des_wav, block_size):
+        loss.update(des, np.clip(model.process(x), -1, 1)) # compiled plugin output is fixed-point
+
+    return loss.result()
+
+def get_error_for_wav(out_wav, des_wav):
+    """
+    Calculate the error for a rendered output wav file,
+    streamed in blocks if STREAMING_BLOCK_SIZE is set
+    """
+    if STREAMING_BLOCK_SIZE is not None:
+        return calc_error_streaming(des_wav, out_wav, STREAMING_BLOCK_SIZE)
+
+    fs, y_test = read_wav(out_wav)
+    return get_target_loss(des_wav)(y_test)
+
+def get_error_and_grad_for_model_python(params, model, in_wav, des_wav):
+    """
+    Calculate error for a model and parameters using the Python backend,
+    along with the gradient of the error with respect to the parameters
+    """
+    model.set_params(params)
+
+    fs, x = load_wav(in_wav)
+    y, dy = model.process_jvp(x)
+
+    error, grad_out = get_target_loss(des_wav).grad(np.clip(y, -1, 1))
+    grad_out = grad_out * (np.abs(y) < 1) # compiled plugin output is fixed-point
+
+    return error, np.tensordot(grad_out, dy, axes=([0, 1], [0, 1]))
+
+def get_errors_for_population(population, model, in_wav, des_wav, batch_size=None):
+    """
+    Calculate the error for every parameter vector (row) in `population` using the
+    Python backend, rendering `batch_size` parameter vectors at a time
+    (see Model.process_batch()). By default, the batches are as large as
+    fit in BATCH_MEMORY.
+    """
+    fs, x = load_wav(in_wav)
+    loss = get_target_loss(des_wav)
+
+    if batch_size is None:
+        # the input, output, intermediate signals and loss each take about one copy of the audio per parameter vector
+        batch_size = max(1, min(len(population), BATCH_MEMORY // (4 * np.size(x) * 8)))
+
+    errors = np.zeros(len(population))
+    for start in range(0, len(population), batch_size):
+        batch = population[start:start+batch_size]
+        y_test = np.clip(model.process_batch(x, batch), -1, 1) # compiled plugin output is fixed-point
+        errors[start:start+len(batch)] = loss.batch(y_test)
+
+    return errors
+
+
+def get_error_for_model_vst(params, model, name, in_wav, out_wav, des_wav, directory=None):
     """
     Calculate error for a model and parameters, by compiling to a VST
     plugin, running audio through, and comparing the output audio with the desired
     """
     # compile and test plugin
     model.set_params(params)
-    model.write_to_file(name + '.dsp')
-    compile_plugin(name)
-    test_plugin(name, in_wav, out_wav)
+    compile_model(model, name, directory=directory)
+    test_plugin(name, in_wav, out_wav, directory)
 
     # read wav files
-    fs, y = wavfile.read(des_wav)
-    fs, y_test = wavfile.read(out_wav)
-
-    # normalize for wav files
-    y = y / 2**15 if np.max(np.abs(y)) > 10 else y
-    y_test = y_test / 2**15 if np.max(np.abs(y_test)) > 10 else y_test
+    return get_error_for_wav(out_wav, des_wav)
 
-    return calc_error(y, y_test, fs)
+class ParamSampler:
+    """
+    Samples whole populations of parameter vectors (one per row) for the
+    genetic algorithms, clipped to the parameter bounds (see Model.get_params()).
+    Pass a `seed` for reproducible populations.
+    """
+    def __init__(self, bounds, seed=None):
+        bounds = np.array(bounds, dtype=float).reshape(-1, 2)
+        self.lower = bounds[:,0]
+        self.upper = bounds[:,1]
+        self.rng = np.random.default_rng(seed)
+
+    def sample(self, means, N, scale):
+        """
+        Returns N parameter vectors, normally distributed around the rows of `means`
+        (taken in turn), with standard deviation `scale` times the width of the bounds
+        """
+        means = np.atleast_2d(means)
+        means = means[np.arange(N) % len(means)]
+        return np.clip(self.rng.normal(means, scale * (self.upper - self.lower)), self.lower, self.upper)
+
+    def random(self, N):
+        """Returns N parameter vectors, spread over the bounds"""
+        return self.sample((self.lower + self.upper) / 2, N, 1.0)
 
 # Fallbak GA for feedback parameters
-def estimate_params_GA(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
+def estimate_params_GA(model, name, in_wav, out_wav, des_wav, tol=1.0e-5, backend='faust', seed=None):
+    """
+    Estimate parameters for a model using a genetic algorithm. With
+    `backend='python'`, each generation is rendered in vectorized batches.
+    Pass a `seed` for reproducible results.
+    """
     N_pop = 500
     N_gens = 30
     N_survive = 2
 
     params, bounds = model.get_params()
-    error = get_error_for_model(params, model, name, in_wav, out_wav, des_wav)
-    generation = create_generation(params, bounds, error, N_pop)
+    sampler = ParamSampler(bounds, seed)
+    error = get_error_for_model(params, model, name, in_wav, out_wav, des_wav, backend)
+    generation = sampler.sample(params, N_pop, error / 10)
 
     gen_num = 0
     converged = False
     while gen_num < N_gens:
         print(f'Testing generation: {gen_num}')
-        errors = np.zeros(N_pop)
-        for n in tqdm(range(N_pop)):
-            errors[n] = get_error_for_model(generation[n], model, name, in_wav, out_wav, des_wav)
-
-        # sort
-        aridxs = np.argsort(errors)
-        errors = errors[aridxs]
-        generation = [generation[i] for i in aridxs]
+        if backend == 'python':
+            errors = get_errors_for_population(generation, model, in_wav, des_wav)
+        else:
+            errors = np.zeros(N_pop)
+            for n in tqdm(range(N_pop)):
+                errors[n] = get_error_for_model(generation[n], model, name, in_wav, out_wav, des_wav, backend)
 
         # Take N_survive best
-        errors = errors[:N_survive]
-        generation = generation[:N_survive]
+        aridxs = np.argsort(errors)[:N_survive]
+        errors = errors[aridxs]
+        generation = generation[aridxs]
 
-        print('Surviving errors: {}'.format(errors[:N_survive]))
-        print('Surviving params: {}'.format(generation[:N_survive]))
+        print('Surviving errors: {}'.format(errors))
+        print('Surviving params: {}'.format(generation))
 
         # check for correct answer
         if errors[0] <= tol:
             converged = True
             break
 
-        # mutate off survivors
-        generation = create_generation(generation[0], bounds, errors[0], N_pop, generation)
+        # mutate off best survivor
+        generation = np.concatenate((generation, sampler.sample(generation[0], N_pop - N_survive, errors[0] / 10)))
         gen_num += 1
 
     if converged:
@@ -129,18 +456,6 @@ def estimate_params_GA(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
     # return best params
     return generation[0]
 
-def create_generation(params, bounds, error, N, generation=[]):
-    while len(generation) < N:
-        new_params = np.zeros_like(params)
-        for i in range(len(params)):
-            stddev = (bounds[i][1] - bounds[i][0]) * (error / 10)
-            mean = params[i]
-            new_params[i] = np.clip(np.random.normal(mean, stddev), bounds[i][0], bounds[i][1])
-        
-        generation.append(new_params)
-
-    return generation
-
 ####################################################
 # Old genetic algorithm code... not currently in use
 def estimate_params(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
@@ -150,11 +465,10 @@ def estimate_params(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
     N_survive = 2
 
     params, bounds = model.get_params()
+    sampler = ParamSampler(bounds)
 
     # create initial generation
-    generation = []
-    for n in range(N_pop):
-        generation.append(init_rand_params(params, bounds))
+    generation = sampler.random(N_pop)
 
     gen_num = 0
     converge = False
@@ -165,14 +479,10 @@ def estimate_params(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
         for n in tqdm(range(N_pop)):
             errors[n] = get_error_for_model(generation[n], model, name, in_wav, out_wav, des_wav)
         
-        # sort
-        aridxs = np.argsort(errors)
-        errors = errors[aridxs]
-        generation = [generation[i] for i in aridxs]
-
         # Take N_survive best
-        errors = errors[:N_survive]
-        generation = generation[:N_survive]
+        aridxs = np.argsort(errors)[:N_survive]
+        errors = errors[aridxs]
+        generation = generation[aridxs]
 
         # print('Best error: {}'.format(errors[0]))
         # print('Best params: {}'.format(generation[0]))
@@ -186,8 +496,8 @@ def estimate_params(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
             break
 
         # mutate off survivors
-        for n in range(N_survive, N_pop):
-            generation.append(mutate_params(generation[n % N_survive], bounds, gen_num, N_gens))
+        scale = (1 - (gen_num / N_gens))**gen_num
+        generation = np.concatenate((generation, sampler.sample(generation, N_pop - N_survive, scale)))
 
         gen_num += 1
     
@@ -201,24 +511,3 @@ def estimate_params(model, name, in_wav, out_wav, des_wav, tol=1.0e-5):
 
     # return best params
     return generation[0]
-
-
-def init_rand_params(params, bounds):
-    """Initialize a random set of parameters"""
-    new_params = np.zeros(np.shape(params))
-    for i in range(len(params)):
-        stddev = bounds[i][1] - bounds[i][0]
-        mean = (bounds[i][0] + bounds[i][1]) / 2
-        new_params[i] = np.clip(np.random.normal(mean, stddev), bounds[i][0], bounds[i][1])
-
-    return new_params
-
-def mutate_params(parent_params, bounds, gen_num, N_gens):
-    """Mutate on a set of parameters"""
-    new_params = np.zeros(np.shape(parent_params))
-    for i in range(len(parent_params)):
-        stddev = (bounds[i][1] - bounds[i][0]) * (1 - (gen_num / N_gens))**gen_num
-        mean = parent_params[i]
-        new_params[i] = np.clip(np.random.normal(mean, stddev), bounds[i][0], bounds[i][1])
-
-    return new_params
@@ -5,11 +5,20 @@ from a Python model
 
 #%%
 import os
-import subprocess
+import glob
+import shutil
+import tempfile
 from sys import platform
+from collections import OrderedDict
 import numpy as np
 import scipy.signal as signal
+from scipy.io import wavfile
 import matplotlib.pyplot as plt
+import compile_cache
+from toolchain import run_tool, ToolchainError
+
+# VST SDK used by the faust2vst scripts (relative to the repository root)
+VST_SDK = 'modules/JUCE/VST2_SDK'
 
 # %%
 def get_platform_specific_args():
@@ -17,7 +26,6 @@ def get_platform_specific_args():
     Get correct arguments for the current platform
     """
     vst_script = 'crossroads_scripts/myfaust2faustvst'
-    pipe = " > /dev/null 2>&1"
     if platform == "linux" or platform == "linux2": # linux
         runner = 'modules/PluginRunner/PluginRunnerLinux'
         vst_ext = ".so"
@@ -28,55 +36,444 @@ def get_platform_specific_args():
         vst_script = 'crossroads_scripts/faust2w64vst.sh'
         runner = 'modules/PluginRunner/PluginRunner.exe'
         vst_ext = ".dll"
-        pipe = " > NUL"
     
-    return vst_script, vst_ext, runner, pipe
+    return vst_script, vst_ext, runner
+
+# %%
+# Scratch directories for model evaluations are kept in tmpfs where available
+SCRATCH_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+def scratch_dir(name):
+    """
+    Context manager for a private scratch directory (named after `name`),
+    which is removed along with any generated files on exit. Use this so that
+    parallel evaluations never share faust scripts, executables or wav files.
+    """
+    return tempfile.TemporaryDirectory(prefix=name + '-', dir=SCRATCH_ROOT)
+
+def remove_files(*files):
+    """Remove files, ignoring any that do not exist"""
+    for f in files:
+        if os.path.exists(f):
+            os.remove(f)
+
+def get_plugin_dirs(plugin, directory=None):
+    """
+    Locations of the faust script directory and compiled plugin folder for a plugin.
+    By default these are `faust_scripts/` and `faust_plugins/{plugin}/`,
+    otherwise both are kept in the given (scratch) directory.
+    """
+    if directory is None:
+        return 'faust_scripts', 'faust_plugins/' + plugin
+    return directory, os.path.join(directory, plugin)
 
 #%%
-def compile_plugin(plugin, check_success=False):
+def compile_plugin(plugin, check_success=False, directory=None):
     """
     Compile faust script to a vst plugin.
     Faust script should be located in `faust_scripts/{plugin}.dsp`
     Resulting plugin and svg diagrams will be located in `faust_plugins/{plugin}/`
+    (or both in `directory`, see get_plugin_dirs())
+    Raises a toolchain.ToolchainError if compilation fails
     """
-    vst_script, vst_ext, _, pipe = get_platform_specific_args()
+    vst_script, vst_ext, _ = get_platform_specific_args()
 
     # set up files
-    faust_file = 'faust_scripts/' + plugin + '.dsp'
-    orig_plugin_file = 'faust_scripts/' + plugin + vst_ext
-    cp_plugin_file = 'faust_plugins/' + plugin + '/' + plugin + vst_ext
+    script_dir, plugin_dir = get_plugin_dirs(plugin, directory)
+    orig_plugin_file = os.path.join(script_dir, plugin + vst_ext)
+    cp_plugin_file = os.path.join(plugin_dir, plugin + vst_ext)
 
-    os.system("bash " + vst_script + " " + faust_file + pipe) # run faust2vst bash script
-    os.system('rm -rf faust.*') # remove faust residuals
+    # run faust2vst bash script from the script directory, so that any
+    # faust residuals are kept out of the way of other processes. The scripts
+    # find the VST SDK relative to the repository root, so pass its absolute path.
+    sdk = os.path.abspath(VST_SDK)
+    try:
+        run_tool('faust2vst', ['bash', os.path.realpath(vst_script), plugin + '.dsp'], cwd=script_dir,
+                 env=dict(os.environ, SDK=sdk, VST=sdk))
+    except ToolchainError as e:
+        # if checking for succesful compilation (used for unit tests)
+        if check_success:
+            print(e)
+            exit(1)
+        raise
+    finally:
+        for f in glob.glob(os.path.join(script_dir, 'faust.*')): # remove faust residuals
+            shutil.rmtree(f, ignore_errors=True)
 
     # clean existing plugin folder (if it exists)
-    os.system('rm -rf faust_plugins/' + plugin)
-    os.mkdir('faust_plugins/' + plugin)
+    shutil.rmtree(plugin_dir, ignore_errors=True)
+    os.mkdir(plugin_dir)
 
     # move plugin and svg diagrams to folder
-    res = os.system('mv faust_scripts/' + plugin + '-svg faust_plugins/' + plugin + '/svgs', )  
-    mv_cmd = 'mv ' + orig_plugin_file + ' ' + cp_plugin_file
-    os.system(mv_cmd)
-
-    # if checking for succesful compilation (used for unit tests)
-    if res != 0 and check_success:
-        exit(res)
+    shutil.move(os.path.join(script_dir, plugin + '-svg'), os.path.join(plugin_dir, 'svgs'))
+    shutil.move(orig_plugin_file, cp_plugin_file)
 
 # compile_plugin('test')
 
 #%%
-def test_plugin(plugin, in_wav, out_wav):
+def compile_model(model, plugin, check_success=False, directory=None):
+    """
+    Write a model to `faust_scripts/{plugin}.dsp` and compile it to a vst plugin
+    (see compile_plugin), re-using a previously compiled plugin if the same
+    model has been compiled before (with the elements renamed in the svgs)
+    """
+    _, vst_ext, _ = get_platform_specific_args()
+    script_dir, plugin_dir = get_plugin_dirs(plugin, directory)
+    model.write_to_file(plugin + '.dsp', directory=script_dir)
+
+    artifacts = {'plugin' + vst_ext: os.path.join(plugin_dir, plugin + vst_ext),
+                 'svgs': os.path.join(plugin_dir, 'svgs')}
+
+    key = compile_cache.get_model_key(model, 'vst')
+    shutil.rmtree(plugin_dir, ignore_errors=True)
+    os.mkdir(plugin_dir)
+    if compile_cache.fetch(key, artifacts, names=model.get_names()):
+        return
+
+    compile_plugin(plugin, check_success, directory)
+    compile_cache.store(key, artifacts, names=model.get_names())
+
+#%%
+def test_plugin(plugin, in_wav, out_wav, directory=None):
     """
     Test a plugin using the PluginRunner application
+    Raises a toolchain.ToolchainError if the plugin cannot be run
     """
-    _, vst_ext, runner, pipe = get_platform_specific_args()
+    _, vst_ext, runner = get_platform_specific_args()
 
-    plugin_file = 'faust_plugins/' + plugin + '/' + plugin + vst_ext
+    _, plugin_dir = get_plugin_dirs(plugin, directory)
+    plugin_file = os.path.join(plugin_dir, plugin + vst_ext)
 
-    os.system(os.path.realpath(runner) + " " + plugin_file + " " + in_wav + " " + out_wav + pipe)
+    run_tool('plugin_runner', [os.path.realpath(runner), plugin_file, in_wav, out_wav])
 
 # test_plugin('test', 'drums.wav', 'drums_out.wav')
 
+# %%
+BLOCK_SIZE = 2**16 # samples
+
+def get_wav_scale(y, block_size=BLOCK_SIZE):
+    """
+    Returns the scale that wav data is divided by to normalize it (2**15 for
+    integer wav data), found from the peak one block at a time
+    """
+    peak = max((np.max(np.abs(np.asarray(y[start:start+block_size], dtype=float)))
+                for start in range(0, len(y), block_size)), default=0)
+    return 2**15 if peak > 10 else 1
+
+def read_wav(wav_file):
+    """
+    Read a wav file, and normalize integer
+    wav data to the range [-1, 1]
+    """
+    fs, y = wavfile.read(wav_file)
+    scale = get_wav_scale(y)
+    return fs, y / scale if scale != 1 else y
+
+def get_file_key(file):
+    """Key identifying a file and its current version"""
+    stat = os.stat(file)
+    return (os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+
+def get_wav_blocks(wav_file, block_size=BLOCK_SIZE):
+    """
+    Returns the sample rate and a generator of blocks of a wav file, normalized
+    in the same way as read_wav(). The file is memory-mapped, so only one
+    block is in memory at a time.
+    """
+    fs, y = wavfile.read(wav_file, mmap=True)
+    scale = get_wav_scale(y, block_size)
+
+    def blocks():
+        for start in range(0, len(y), block_size):
+            yield np.asarray(y[start:start+block_size], dtype=float) / scale
+
+    return fs, blocks()
+
+def get_wav_block_pairs(wav_file1, wav_file2, block_size=BLOCK_SIZE):
+    """
+    Returns a generator of corresponding blocks of two wav files (see get_wav_blocks()).
+    Raises a ValueError if the files are not the same length.
+    """
+    len1, len2 = (len(wavfile.read(f, mmap=True)[1]) for f in (wav_file1, wav_file2))
+    if len1 != len2:
+        raise ValueError('{} and {} have different lengths ({} and {} samples)'.format(wav_file1, wav_file2, len1, len2))
+
+    _, blocks1 = get_wav_blocks(wav_file1, block_size)
+    _, blocks2 = get_wav_blocks(wav_file2, block_size)
+    return zip(blocks1, blocks2)
+
+def write_transient_excerpt(dry_file, des_file, length, directory):
+    """
+    Write the most transient-rich `length` seconds of a dry/desired pair of wav
+    files to `directory` (as `excerpt_dry.wav` and `excerpt_des.wav`), choosing the
+    excerpt with the largest total increase in short-time RMS of the dry signal.
+    Returns the excerpt files, or None if the audio is not longer than `length`.
+    """
+    hop = 512
+    fs, x = wavfile.read(dry_file, mmap=True)
+    _, des = wavfile.read(des_file, mmap=True)
+    num_samples = int(length * fs)
+    if min(len(x), len(des)) <= num_samples:
+        return None
+
+    # short-time RMS, one block at a time to keep memory bounded
+    rms = []
+    _, blocks = get_wav_blocks(dry_file, hop * 256)
+    for block in blocks:
+        frames = block[:len(block) // hop * hop].reshape(-1, hop, *np.shape(block)[1:]) # mono or multichannel
+        rms.append(np.sqrt(np.mean(frames**2, axis=tuple(range(1, frames.ndim)))))
+    rms = np.concatenate(rms)
+    flux = np.maximum(np.diff(rms, prepend=0), 0)
+
+    # total flux of every excerpt-length window
+    window = num_samples // hop
+    flux_sum = np.convolve(flux, np.ones(window), mode='valid')
+    start = int(np.argmax(flux_sum[:(min(len(x), len(des)) - num_samples) // hop + 1])) * hop
+
+    excerpt_files = (os.path.join(directory, 'excerpt_dry.wav'), os.path.join(directory, 'excerpt_des.wav'))
+    wavfile.write(excerpt_files[0], fs, np.array(x[start:start+num_samples]))
+    wavfile.write(excerpt_files[1], fs, np.array(des[start:start+num_samples]))
+    return excerpt_files
+
+WAV_CACHE_SIZE = 4 # e.g. the dry and desired audio, and their excerpts
+wav_cache = OrderedDict()
+shared_wavs = {} # absolute path -> (fs, read-only float32 array), see attach_shared_wavs()
+
+def get_wav_key(wav_file):
+    """Key for caching data derived from a wav file (shared audio does not change during a run)"""
+    path = os.path.abspath(wav_file)
+    return path if path in shared_wavs else get_file_key(wav_file)
+
+def load_wav(wav_file):
+    """
+    Same as read_wav(), but the file is only read once
+    (unless it has been modified since). Audio that has been
+    shared with this process is used without touching the file.
+    """
+    path = os.path.abspath(wav_file)
+    if path in shared_wavs:
+        return shared_wavs[path]
+
+    return get_cached(wav_cache, get_file_key(wav_file), lambda: read_wav(wav_file), WAV_CACHE_SIZE)
+
+def get_cached(cache, key, compute, max_size):
+    """
+    Returns `cache[key]`, computing it with `compute()` if missing. Only the `max_size`
+    most recently used entries of the cache (an OrderedDict) are kept, so that long-lived
+    worker processes don't keep every file they have seen in memory.
+    """
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    cache[key] = value = compute()
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+    return value
+
+class SharedWavs:
+    """
+    Loads wav files once, as float32 arrays in memory-mapped files (in tmpfs where
+    available), so that worker processes can attach to them without copying or
+    re-reading the wav files. Use as a context manager, which returns the handles
+    to pass to attach_shared_wavs() (e.g. as a multiprocessing.Pool initializer).
+    """
+    def __init__(self, wav_files):
+        self.directory = scratch_dir('shared_wavs')
+        self.handles = []
+        for n, wav_file in enumerate(wav_files):
+            fs, y = read_wav(wav_file)
+            buffer_file = os.path.join(self.directory.name, '{}.raw'.format(n))
+            buffer = np.memmap(buffer_file, dtype=np.float32, mode='w+', shape=np.shape(y))
+            buffer[:] = y
+            buffer.flush()
+            self.handles.append((os.path.abspath(wav_file), fs, np.shape(y), buffer_file))
+
+    def __enter__(self):
+        return self.handles
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Remove the shared buffers (processes that have attached keep their mappings)"""
+        self.directory.cleanup()
+
+def attach_shared_wavs(handles):
+    """Use shared audio (see SharedWavs) for load_wav() in this process"""
+    for wav_file, fs, shape, buffer_file in handles:
+        shared_wavs[wav_file] = (fs, np.memmap(buffer_file, dtype=np.float32, mode='r', shape=shape))
+
+# %%
+class TargetLoss:
+    """
+    Error function for a fixed desired signal, using a combination
+    of mean-squared error and spectrogram loss. The desired signal's
+    mono mixdown and STFT are computed once, so only the output signal
+    needs to be analyzed for each call.
+    """
+    nseg = 2048 # hop size
+
+    def __init__(self, des_wav, fs):
+        self.des_wav = des_wav
+        self.fs = fs
+
+        # sum to mono (maybe do stereo eventually...)
+        # in double precision, even if the desired audio is shared as float32
+        self.des = (des_wav[:,0].astype(float) + des_wav[:,1]) / 2
+        self.Z_des = self.stft(self.des)
+
+    def stft(self, x):
+        """STFT used for the spectrogram loss"""
+        _, _, Z = signal.stft(x, fs=self.fs, nperseg=self.nseg, nfft=self.nseg*2)
+        return Z
+
+    def __call__(self, out_wav):
+        """Calculate the error between the desired signal and an output signal"""
+        mean_square_error = np.mean((self.des_wav - out_wav)**2, axis=None) # get mean squared error
+
+        # compute spectrogram error
+        out = (out_wav[:,0] + out_wav[:,1]) / 2
+        Z_out = self.stft(out)
+        freq_err = np.mean(np.abs(self.Z_des - Z_out), axis=None)
+
+        return mean_square_error + freq_err
+
+    def batch(self, out_wavs):
+        """
+        Calculate the error for a batch of output signals,
+        stacked along an extra last axis
+        """
+        diff = self.des_wav[...,np.newaxis] - out_wavs
+        mean_square_error = np.mean(diff**2, axis=(0, 1))
+
+        # STFT one signal at a time, to keep memory use bounded
+        out = (out_wavs[:,0] + out_wavs[:,1]) / 2
+        freq_err = np.zeros(np.shape(out)[1:])
+        for n in np.ndindex(*np.shape(freq_err)):
+            Z_out = self.stft(out[(slice(None),) + n])
+            freq_err[n] = np.mean(np.abs(self.Z_des - Z_out), axis=None)
+
+        return mean_square_error + freq_err
+
+    def stft_adjoint(self, G, num_samples):
+        """
+        Adjoint of the (linear) STFT used for the spectrogram loss,
+        i.e. maps the gradient with respect to the STFT frames back
+        to the gradient with respect to the signal
+        """
+        nfft = self.nseg * 2
+        hop = self.nseg // 2
+        win = signal.get_window('hann', self.nseg)
+        win = win / win.sum() # 'spectrum' scaling
+
+        # adjoint of the one-sided FFT (DC and Nyquist bins are not repeated)
+        G = np.array(G)
+        G[1:-1] /= 2
+        frames = np.fft.irfft(G, n=nfft, axis=0)[:self.nseg] * nfft
+        frames *= win[:,np.newaxis]
+
+        # overlap-add, then remove boundary padding
+        pad = self.nseg // 2
+        num_frames = frames.shape[1]
+        grad = np.zeros(self.nseg + (num_frames - 1) * hop)
+        for k in range(num_frames):
+            grad[k*hop:k*hop+self.nseg] += frames[:,k]
+        return grad[pad:pad+num_samples]
+
+    def grad(self, out_wav):
+        """
+        Calculate the error between the desired signal and an output signal,
+        along with the gradient of the error with respect to the output signal
+        """
+        diff = out_wav - self.des_wav
+        mean_square_error = np.mean(diff**2, axis=None)
+        grad = 2 * diff / np.size(diff)
+
+        out = (out_wav[:,0] + out_wav[:,1]) / 2
+        E = self.Z_des - self.stft(out)
+        E_abs = np.abs(E)
+        freq_err = np.mean(E_abs, axis=None)
+
+        # d|E|/dZ_out = -E/|E| (zero where E = 0)
+        G = -np.divide(E, E_abs, out=np.zeros_like(E), where=E_abs > 0) / np.size(E)
+        grad_mono = self.stft_adjoint(G, len(out))
+        grad[:,0] += grad_mono / 2
+        grad[:,1] += grad_mono / 2
+
+        return mean_square_error + freq_err, grad
+
+class StreamingLoss:
+    """
+    Same error as TargetLoss, but accumulated incrementally from blocks
+    of the desired and output signals (see update()), so that memory use
+    does not depend on the length of the signals. The spectrogram loss
+    is computed from overlapping frames of the difference signal
+    (the STFT is linear), matching the frames used by TargetLoss.stft().
+    """
+    nseg = TargetLoss.nseg
+
+    def __init__(self):
+        self.hop = self.nseg // 2
+        self.win = signal.get_window('hann', self.nseg)
+        self.win = self.win / self.win.sum() # 'spectrum' scaling
+
+        self.square_error = 0.0
+        self.num_values = 0
+        self.num_samples = 0
+        self.freq_error = 0.0
+        self.num_frames = 0
+        self.buffer = np.zeros(self.nseg // 2) # boundary padding
+
+    def update(self, des_block, out_block):
+        """Add the next block of the desired and output signals"""
+        diff = des_block - out_block
+        self.square_error += np.sum(diff**2)
+        self.num_values += np.size(diff)
+        self.num_samples += len(diff)
+
+        self.buffer = np.concatenate((self.buffer, (diff[:,0] + diff[:,1]) / 2))
+        self.process_frames()
+
+    def process_frames(self):
+        """Add the spectrogram error for every complete frame in the buffer"""
+        if len(self.buffer) < self.nseg:
+            return
+
+        num_frames = (len(self.buffer) - self.nseg) // self.hop + 1
+        idxs = self.hop * np.arange(num_frames)[:,np.newaxis] + np.arange(self.nseg)
+        Z = np.fft.rfft(self.buffer[idxs] * self.win, n=self.nseg*2, axis=1)
+
+        self.freq_error += np.sum(np.abs(Z))
+        self.num_frames += num_frames
+        self.buffer = self.buffer[num_frames*self.hop:]
+
+    def result(self):
+        """Returns the error for the whole signal (call once, after the last block)"""
+        # boundary padding, plus zero padding to fit the last frame (as in scipy.signal.stft)
+        padded_length = self.num_samples + self.nseg
+        num_pad = (-(padded_length - self.nseg) % self.hop) % self.nseg
+        self.buffer = np.concatenate((self.buffer, np.zeros(self.nseg // 2 + num_pad)))
+        self.process_frames()
+
+        mean_square_error = self.square_error / self.num_values
+        freq_err = self.freq_error / (self.num_frames * (self.nseg + 1))
+        return mean_square_error + freq_err
+
+LOSS_CACHE_SIZE = 2 # e.g. the desired audio and its excerpt
+loss_cache = OrderedDict()
+
+def get_target_loss(des_file):
+    """
+    Returns the TargetLoss for a desired wav file, which
+    is only loaded and analyzed once (while it is in use)
+    """
+    def compute():
+        fs, y = load_wav(des_file)
+        return TargetLoss(y, fs)
+
+    return get_cached(loss_cache, get_wav_key(des_file), compute, LOSS_CACHE_SIZE)
+
 # %%
 def calc_error(des_wav, out_wav, fs):
     """
@@ -84,17 +481,15 @@ def calc_error(des_wav, out_wav, fs):
     using a combination  of mean-squared error
     and spectrogram loss
     """
-    mean_square_error = np.mean((des_wav - out_wav)**2, axis=None) # get mean squared error
-
-    nseg = 2048 # hop size
+    return TargetLoss(des_wav, fs)(out_wav)
 
-    # sum to mono (maybe do stereo eventually...)
-    des = (des_wav[:,0] + des_wav[:,1]) / 2
-    out = (out_wav[:,0] + out_wav[:,1]) / 2
-
-    # compute spectrogram error
-    _, _, Z_des = signal.stft(des, fs=fs, nperseg=nseg, nfft=nseg*2)
-    _, _, Z_out = signal.stft(out, fs=fs, nperseg=nseg, nfft=nseg*2)
-    freq_err = np.mean(np.abs(Z_des - Z_out), axis=None)
+def calc_error_streaming(des_file, out_file, block_size=BLOCK_SIZE):
+    """
+    Same as calc_error(), but for two wav files that are read and
+    scored one block at a time (see StreamingLoss)
+    """
+    loss = StreamingLoss()
+    for des_block, out_block in get_wav_block_pairs(des_file, out_file, block_size):
+        loss.update(des_block, out_block)
 
-    return mean_square_error + freq_err
+    return loss.result()
@@ -0,0 +1,59 @@
+"""
+Instrumentation for evolution runs: events are written to a
+structured (JSON lines) log, and passed to any user callbacks
+"""
+
+import os
+import json
+import time
+import cProfile
+
+class Telemetry:
+    """
+    Records events from an evolution run. Each event is a dict with
+    an 'event' name, a timestamp, and event-specific data, e.g.:
+     - 'evaluation': one model evaluated (error, optimize time, iterations, cache hits/misses, ...)
+     - 'generation': one generation finished (wall time, pool utilization, surviving errors)
+     - 'run': the whole evolution finished
+    Events are appended to `log_file` (if given), and passed to each callback.
+    """
+    def __init__(self, log_file=None, callbacks=()):
+        self.log = open(log_file, 'a') if log_file is not None else None
+        self.callbacks = [c for c in callbacks if c is not None]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def emit(self, event, **data):
+        """Record an event"""
+        record = dict(event=event, time=time.time(), **data)
+        if self.log is not None:
+            self.log.write(json.dumps(record, default=str) + '\n')
+            self.log.flush()
+
+        for callback in self.callbacks:
+            callback(record)
+
+    def close(self):
+        """Close the log file"""
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+def profile_call(profile_file, func, *args):
+    """
+    Call `func(*args)`, and if `profile_file` is not None,
+    save a cProfile of the call there (view with pstats or snakeviz)
+    """
+    if profile_file is None:
+        return func(*args)
+
+    os.makedirs(os.path.dirname(profile_file) or '.', exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(profile_file)
@@ -0,0 +1,69 @@
+"""
+Runner for the external tools used to compile and run
+plugins (faust, g++, faust2vst, PluginRunner, faust2sndfile
+executables), with timeouts, error capture, and timing
+"""
+
+import time
+import subprocess
+from collections import defaultdict
+
+# Timeout (seconds) for each step of the toolchain
+TIMEOUTS = {
+    'faust': 60,
+    'g++': 120,
+    'faust2vst': 300,
+    'plugin_runner': 60,
+    'render': 60,
+}
+
+# Number of runs and total wall time (seconds) of each step, in this process
+timings = defaultdict(lambda: [0, 0.0])
+
+class ToolchainError(Exception):
+    """Raised when a toolchain step fails, or does not finish in time"""
+    def __init__(self, step, args, returncode, stderr):
+        self.step = step
+        self.args_list = args
+        self.returncode = returncode
+        self.stderr = stderr
+        super().__init__('{} failed ({}): {}\n{}'.format(step, 'timed out' if returncode is None else 'exit code {}'.format(returncode),
+                                                          ' '.join(args), stderr.strip()))
+
+    def __reduce__(self): # so that errors can be passed back from worker processes
+        return (ToolchainError, (self.step, self.args_list, self.returncode, self.stderr))
+
+def run_tool(step, args, cwd=None, timeout=None, env=None):
+    """
+    Run one step of the toolchain, with the given argument list (and
+    environment `env`, if given, otherwise this process's environment).
+    stdout is discarded, and stderr is captured for error reporting.
+    Raises a ToolchainError if the step fails or times out.
+    """
+    timeout = timeout if timeout is not None else TIMEOUTS.get(step)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(args, cwd=cwd, env=env, timeout=timeout, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    except subprocess.TimeoutExpired as e:
+        record_timing(step, start)
+        stderr = e.stderr.decode(errors='replace') if isinstance(e.stderr, bytes) else (e.stderr or '')
+        raise ToolchainError(step, args, None, stderr)
+    except OSError as e: # e.g. tool not installed
+        record_timing(step, start)
+        raise ToolchainError(step, args, e.errno, str(e))
+
+    record_timing(step, start)
+    if result.returncode != 0:
+        raise ToolchainError(step, args, result.returncode, result.stderr)
+
+    return result
+
+def record_timing(step, start):
+    """Add a run of a step, started at time.perf_counter() `start`, to the timings"""
+    timings[step][0] += 1
+    timings[step][1] += time.perf_counter() - start
+
+def get_timing_summary():
+    """Returns {step: (number of runs, total seconds)} for this process"""
+    return {step: tuple(t) for step, t in timings.items()}
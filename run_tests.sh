@@ -12,6 +12,8 @@ elif [[ $1 == "--evolve" ]]; then
     pattern=test_scripts/e_test_*.py
 elif [[ $1 == "--params" ]]; then
     pattern=test_scripts/p_test_*.py
+elif [[ $1 == "--bench" ]]; then
+    pattern=test_scripts/b_test_*.py
 fi
 
 if [ -z "$1" ]; then
@@ -0,0 +1,171 @@
+"""
+Benchmark suite for the model evaluation pipeline. Times each
+stage of an evaluation separately (codegen, faust, g++, render,
+wav I/O, loss), for models from a single gain up to deep
+Split/Feedback graphs, and signal lengths from 1 second to a few minutes.
+
+Results are written to `bench_results.json`, and compared against
+`bench_baseline.json` if it exists.
+
+Usage: python test_scripts/b_test_pipeline.py [--quick] [--save-baseline]
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from gen_faust import Model,Gain,UnitDelay,Delay,CubicNL,Split,Feedback,FB2
+from plugin_utils import read_wav, scratch_dir, TargetLoss
+from param_estimation import get_sndfile_paths, using_sndfile, render_model_python
+from toolchain import run_tool, ToolchainError
+from scipy.io import wavfile
+import numpy as np
+import platform
+import json
+import time
+
+RESULTS_FILE = 'bench_results.json'
+BASELINE_FILE = 'bench_baseline.json'
+REGRESSION_THRESHOLD = 2.0 # fail if a stage is this many times slower than the baseline
+MIN_TIME = 0.01 # ignore stages faster than this (seconds) when checking for regressions
+N_REPS = 3
+
+quick = '--quick' in sys.argv
+lengths = [1, 10] if quick else [1, 10, 60, 180] # seconds
+
+def get_models():
+    """Benchmark models, from smallest to largest"""
+    models = {}
+
+    models['gain'] = Model()
+    models['gain'].elements.append(Gain(0.5))
+
+    models['split'] = Model()
+    models['split'].elements.append(Split([[Gain(), Gain()], [UnitDelay(), Gain()], [Gain(0.2)]]))
+
+    models['feedback'] = Model()
+    models['feedback'].elements.append(Gain(0.8))
+    models['feedback'].elements.append(Feedback([Delay(10), Gain(0.5)]))
+    models['feedback'].elements.append(FB2())
+
+    models['deep'] = Model()
+    models['deep'].elements.append(Split([[Gain(0.5), Feedback([Delay(5), Gain(0.3)])],
+                                          [UnitDelay(), Split([[Gain(0.7)], [Delay(20), Gain(0.2)]])],
+                                          [Feedback([UnitDelay(), Gain(-0.4)]), Gain(0.6)]]))
+    models['deep'].elements.append(CubicNL())
+    models['deep'].elements.append(Split([[Gain(0.5)], [Feedback([UnitDelay(), Gain(0.5), FB2()]), Gain(0.1)]]))
+    models['deep'].elements.append(Gain(0.9))
+
+    return models
+
+def time_stage(func, *args):
+    """Returns (median time over N_REPS runs, result of the last run)"""
+    times = []
+    for _ in range(N_REPS):
+        tick = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - tick)
+    return float(np.median(times)), result
+
+def write_wav(file, fs, x):
+    """Write audio the same way the compiled plugins do (16-bit)"""
+    wavfile.write(file, fs, (np.clip(x, -1, 1) * (2**15 - 1)).astype(np.int16))
+
+def bench_model(name, model, dry_files, fs, directory):
+    """Benchmark every stage of the pipeline for one model and all signal lengths"""
+    results = []
+    params, _ = model.get_params()
+
+    # compile stages do not depend on the signal length
+    compile_times = {}
+    compile_times['codegen'], _ = time_stage(model.write_to_file, name + '.dsp', False, directory)
+    sndfile = None
+    if using_sndfile():
+        _, sndfile = get_sndfile_paths(name, directory)
+        try:
+            tick = time.perf_counter()
+            run_tool('faust', ['faust', '-i', '-light', '-a', 'crossroads_scripts/faust_mysndfile.cpp',
+                               os.path.join(directory, name + '.dsp'), '-o', sndfile + '.cpp'])
+            compile_times['faust'] = time.perf_counter() - tick
+
+            tick = time.perf_counter()
+            run_tool('g++', ['g++', '-std=c++11', sndfile + '.cpp', '-o', sndfile, '-lsndfile'])
+            compile_times['g++'] = time.perf_counter() - tick
+        except ToolchainError as e:
+            print('Skipping compiled stages: {}'.format(e))
+            sndfile = None
+
+    for length, (dry_file, x) in dry_files.items():
+        stages = dict(compile_times)
+        loss = TargetLoss(x, fs)
+        out_file = os.path.join(directory, 'out.wav')
+
+        if sndfile is not None:
+            stages['render'], _ = time_stage(run_tool, 'render', [sndfile, dry_file, out_file])
+            stages['wav_read'], (_, y) = time_stage(read_wav, out_file)
+            stages['loss'], _ = time_stage(loss, y)
+
+        def render_python():
+            model.reset()
+            return np.clip(model.process(x), -1, 1)
+
+        stages['python_render'], y = time_stage(render_python)
+        if model.get_tf() is not None:
+            stages['python_render_tf'], _ = time_stage(render_model_python, model, x)
+        stages['python_loss'], _ = time_stage(loss, y)
+        stages['wav_write'], _ = time_stage(write_wav, out_file, fs, y)
+
+        print('{} ({} params), {} s: '.format(name, len(params), length)
+              + ', '.join('{} {:.4f}'.format(s, t) for s, t in stages.items()))
+        results.append({'model': name, 'num_params': len(params), 'length': length, 'stages': stages})
+
+    return results
+
+def compare_to_baseline(results, baseline):
+    """Returns a list of stages that are slower than the baseline by more than REGRESSION_THRESHOLD"""
+    base_times = {(r['model'], r['length'], s): t for r in baseline['results'] for s, t in r['stages'].items()}
+
+    regressions = []
+    for r in results:
+        for s, t in r['stages'].items():
+            key = (r['model'], r['length'], s)
+            if key not in base_times or max(t, base_times[key]) < MIN_TIME:
+                continue
+
+            ratio = t / base_times[key]
+            if ratio > REGRESSION_THRESHOLD:
+                regressions.append('{} {} s {}: {:.4f} s (baseline {:.4f} s)'.format(*key, t, base_times[key]))
+
+    return regressions
+
+# create dry signals of each length from the drums recording
+fs, drums = read_wav('audio_files/drums.wav')
+results = []
+with scratch_dir('bench') as directory:
+    dry_files = {}
+    for length in lengths:
+        num_samples = int(length * fs)
+        x = np.tile(drums, (num_samples // len(drums) + 1, 1))[:num_samples]
+        dry_file = os.path.join(directory, 'dry_{}.wav'.format(length))
+        write_wav(dry_file, fs, x)
+        dry_files[length] = (dry_file, read_wav(dry_file)[1])
+
+    for name, model in get_models().items():
+        results += bench_model(name, model, dry_files, fs, directory)
+
+output = {'machine': platform.node(), 'python': platform.python_version(), 'n_reps': N_REPS, 'results': results}
+with open(RESULTS_FILE, 'w') as f:
+    json.dump(output, f, indent=2)
+print('Results written to {}'.format(RESULTS_FILE))
+
+if '--save-baseline' in sys.argv:
+    with open(BASELINE_FILE, 'w') as f:
+        json.dump(output, f, indent=2)
+    print('Baseline saved to {}'.format(BASELINE_FILE))
+elif os.path.exists(BASELINE_FILE):
+    with open(BASELINE_FILE) as f:
+        regressions = compare_to_baseline(results, json.load(f))
+
+    for r in regressions:
+        print('Regression: ' + r)
+    assert len(regressions) == 0, 'Slower than baseline!!!'
+
+print('SUCCESS')
@@ -4,7 +4,8 @@ Benchmark test for the speed of the parameter estimation iteration function
 
 import os,sys
 sys.path.append(os.path.abspath('crossroads_scripts'))
-from param_estimation import get_error_for_model, get_error_for_model_vst
+from param_estimation import get_error_for_model, get_error_for_model_vst, compile_sndfile, get_error_for_model_server
+from faust_server import FaustServer
 from  gen_faust import Model, Split, Gain, UnitDelay
 import numpy as np
 import time
@@ -26,12 +27,38 @@ tick = time.time()
 for _ in range(N):
     err = get_error_for_model(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav')
     
-time = time.time() - tick
-time_per_iter = time / N
+time_total = time.time() - tick
+time_per_iter = time_total / N
 
 print('Time per iterations: {:.3f} seconds'.format(time_per_iter))
 assert time_per_iter < 10, 'To Slow!!!'
 
+# Time loop (parametric backend, compiled once)
+tick = time.time()
+compile_sndfile(model, plugin, parametric=True)
+for _ in range(N):
+    err = get_error_for_model(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav', backend='parametric')
+
+time_per_iter = (time.time() - tick) / N
+print('Time per iterations (parametric backend): {:.3f} seconds'.format(time_per_iter))
+
+# Time loop (server backend)
+with FaustServer(plugin, orig_file) as server:
+    tick = time.time()
+    for _ in range(N):
+        err = get_error_for_model_server(params, model, server, 'audio_files/drums.wav')
+
+    time_per_iter = (time.time() - tick) / N
+    print('Time per iterations (server backend): {:.3f} seconds'.format(time_per_iter))
+
+# Time loop (Python backend)
+tick = time.time()
+for _ in range(N):
+    err = get_error_for_model(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav', backend='python')
+
+time_per_iter = (time.time() - tick) / N
+print('Time per iterations (Python backend): {:.3f} seconds'.format(time_per_iter))
+
 # check accuracy
 err_fast = get_error_for_model(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav')
 err_slow = get_error_for_model_vst(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav')
@@ -39,5 +66,26 @@ error = np.abs(err_fast - err_slow)
 print('Error: {}'.format(error))
 assert error < 1.0e-5, 'Not accurate enough!!!'
 
+# check parametric backend against sndfile output
+compile_sndfile(model, plugin, parametric=True)
+err_param = get_error_for_model(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav', backend='parametric')
+error = np.abs(err_fast - err_param)
+print('Error (parametric backend): {}'.format(error))
+assert error < 1.0e-5, 'Parametric backend not accurate enough!!!'
+
+# check server backend against sndfile output
+with FaustServer(plugin, orig_file) as server:
+    err_server = get_error_for_model_server(params, model, server, 'audio_files/drums.wav')
+error = np.abs(err_fast - err_server)
+print('Error (server backend): {}'.format(error))
+assert error < 1.0e-5, 'Server backend not accurate enough!!!'
+os.system('rm {}-sndfile'.format(plugin))
+
+# check Python backend against sndfile output
+err_python = get_error_for_model(params, model, plugin, orig_file, out_file, 'audio_files/drums.wav', backend='python')
+error = np.abs(err_fast - err_python)
+print('Error (Python backend): {}'.format(error))
+assert error < 1.0e-5, 'Python backend not accurate enough!!!'
+
 print('SUCCESS')
 
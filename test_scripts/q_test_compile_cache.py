@@ -0,0 +1,72 @@
+"""
+Test the compile cache (without compiling anything)
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from gen_faust import Model,Gain,UnitDelay,Split
+import compile_cache
+import tempfile
+import shutil
+
+def get_model():
+    model = Model()
+    model.elements.append(Split([[Gain(0.5)], [UnitDelay(), Gain(0.2)]]))
+    return model
+
+tmp_dir = tempfile.mkdtemp()
+compile_cache.CACHE_DIR = os.path.join(tmp_dir, 'cache')
+
+# fake plugin and svgs, which contain the element names
+model1 = get_model()
+os.makedirs(os.path.join(tmp_dir, 'plugin1', 'svgs'))
+for name in model1.get_names():
+    with open(os.path.join(tmp_dir, 'plugin1', 'svgs', name + '-0x1.svg'), 'w') as f:
+        f.write('<a xlink:href="{}-0x1.svg">{}</a>'.format(name, name))
+with open(os.path.join(tmp_dir, 'plugin1', 'plugin1.so'), 'w') as f:
+    f.write('plugin')
+
+##########################################
+print('Testing cache hit')
+key = compile_cache.get_model_key(model1, 'vst')
+compile_cache.store(key, {'plugin.so': os.path.join(tmp_dir, 'plugin1', 'plugin1.so'),
+                          'svgs': os.path.join(tmp_dir, 'plugin1', 'svgs')}, names=model1.get_names())
+
+model2 = get_model()
+assert compile_cache.get_model_key(model2, 'vst') == key, 'Cache key should not depend on names!'
+os.mkdir(os.path.join(tmp_dir, 'plugin2'))
+artifacts = {'plugin.so': os.path.join(tmp_dir, 'plugin2', 'plugin2.so'), 'svgs': os.path.join(tmp_dir, 'plugin2', 'svgs')}
+assert compile_cache.fetch(key, artifacts, names=model2.get_names()), 'Cache miss!'
+assert sorted(os.listdir(os.path.join(tmp_dir, 'plugin2'))) == ['plugin2.so', 'svgs'], 'Cache fetch left temporary files!'
+
+##########################################
+print('Testing renamed svgs')
+svgs = sorted(os.listdir(artifacts['svgs']))
+assert svgs == sorted(name + '-0x1.svg' for name in model2.get_names()), 'Svgs not renamed! {}'.format(svgs)
+for name in model2.get_names():
+    with open(os.path.join(artifacts['svgs'], name + '-0x1.svg')) as f:
+        assert f.read() == '<a xlink:href="{}-0x1.svg">{}</a>'.format(name, name), 'Svg contents not renamed!'
+
+##########################################
+print('Testing evicted entry')
+shutil.rmtree(os.path.join(compile_cache.CACHE_DIR, key, 'svgs')) # e.g. evicted during the fetch
+artifacts = {'plugin.so': os.path.join(tmp_dir, 'plugin2', 'plugin3.so'), 'svgs': os.path.join(tmp_dir, 'plugin2', 'svgs3')}
+assert not compile_cache.fetch(key, artifacts, names=model2.get_names()), 'Evicted entry should be a miss!'
+assert sorted(os.listdir(os.path.join(tmp_dir, 'plugin2'))) == ['plugin2.so', 'svgs'], 'Cache miss left temporary files!'
+
+##########################################
+print('Testing toolchain in key')
+harness = os.path.join(tmp_dir, 'harness.cpp')
+with open(harness, 'w') as f:
+    f.write('// harness v1')
+compile_cache.HARNESS_FILES = [harness]
+compile_cache.toolchain_key = None
+key1 = compile_cache.get_model_key(model1, 'sndfile', parametric=True)
+assert compile_cache.get_model_key(model1, 'sndfile', parametric=True) == key1, 'Cache key should be deterministic!'
+with open(harness, 'w') as f:
+    f.write('// harness v2')
+compile_cache.toolchain_key = None
+assert compile_cache.get_model_key(model1, 'sndfile', parametric=True) != key1, 'Cache key should depend on the harness!'
+
+shutil.rmtree(tmp_dir)
+print('SUCCESS')
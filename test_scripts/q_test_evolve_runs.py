@@ -0,0 +1,176 @@
+"""
+Test the evolution loops and their telemetry, with a stubbed
+fitness backend (so nothing is compiled or optimized)
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from gen_faust import Model,Gain,UnitDelay,Split
+from telemetry import Telemetry
+from toolchain import ToolchainError
+from plugin_utils import write_transient_excerpt
+import evolve_structure
+from scipy.io import wavfile
+import numpy as np
+import random
+import tempfile
+import shutil
+import json
+
+def stub_optimize_model(model, plugin, dry_file, wet_file, des_file, tol=1e-5, backend='python', directory=None,
+                        stats=None, prune_error=None):
+    """Stands in for param_estimation.optimize_model(): the error only depends on the number of parameters"""
+    params, _ = model.get_params()
+    error = stub_error(params, model)
+    stats.update({'nit': 1, 'nfev': 1, 'pruned': False, 'linear': False, 'linear_polish': False})
+    if prune_error is not None and error > prune_error:
+        stats.update({'pruned': True, 'pruned_error': error})
+    return params
+
+def stub_error(params, model, *args, **kwargs):
+    """Stands in for param_estimation.get_error_for_model()"""
+    return 1.0e-3 / (1 + len(params))
+
+class StubPool:
+    """Runs jobs immediately, in this process (see multiprocessing.Pool)"""
+    def imap_unordered(self, func, jobs):
+        return map(func, jobs)
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        try:
+            callback(func(*args))
+        except Exception as e:
+            error_callback(e)
+
+def stub_compile_model(model, plugin, *args, **kwargs):
+    """Stands in for plugin_utils.compile_model(), failing like a broken toolchain"""
+    raise ToolchainError('faust2vst', ['faust2vst', plugin], 1, 'stub failure')
+
+save_survivors = evolve_structure.save_survivors
+evolve_structure.optimize_model = stub_optimize_model
+evolve_structure.get_error_for_model = stub_error
+evolve_structure.save_survivors = lambda *args: None
+
+tmp_dir = tempfile.mkdtemp()
+plugin = os.path.join(tmp_dir, 'plugin')
+os.mkdir(plugin)
+
+def read_events(log_file, event=None):
+    with open(log_file) as f:
+        events = [json.loads(line) for line in f]
+    return [e for e in events if event is None or e['event'] == event]
+
+def get_population(N_pop):
+    first = Model()
+    first.elements = evolve_structure.copy_elements(model.elements)
+    return evolve_structure.create_generation([first], N_pop, 1)
+
+model = Model()
+model.elements.append(Split([[Gain()], [UnitDelay(), Gain()]]))
+
+##########################################
+print('Testing pruned evaluations')
+log_file = os.path.join(tmp_dir, 'pruned.jsonl')
+with Telemetry(log_file) as telemetry:
+    args = evolve_structure.get_fitness_args(model, 0, 'prune_test', 'dry.wav', 'wet.wav', 'des.wav', 1e-9, prune_error=1.0e-6)
+    n, error, model_ir, stats = evolve_structure.compute_model_fitness_job((0, args, None))
+    assert stats['pruned'] and error == stats['pruned_error'], 'Candidate not pruned! {}'.format(stats)
+    evolve_structure.emit_evaluation(telemetry, 0, n, error, model_ir.to_model(), stats)
+
+    models, errors = [None], np.zeros(1)
+    evolve_structure.run_fitness_jobs(StubPool(), [(0, args, None)], models, errors, telemetry, 0)
+    assert errors[0] == error and models[0].get_topology() == model.get_topology(), 'Pruned job result incorrect!'
+
+events = read_events(log_file)
+assert len(events) == 2 and all(e['event'] == 'evaluation' and e['pruned'] for e in events), 'Pruned evaluations not recorded!'
+assert events[0]['error'] == error and events[1]['stage'] == 'full', 'Pruned evaluation events incorrect! {}'.format(events)
+
+##########################################
+print('Testing checkpoints')
+random.seed(0x4567)
+np.random.seed(0x4567)
+other = Model()
+other.elements.append(Gain(0.25))
+evolve_structure.save_checkpoint(plugin, {'mode': 'generations', 'gen_num': 3, 'models': [model, other],
+                                          'errors': np.array([1.0e-3, 2.0e-3]), 'N_pop': 8, 'converged': False})
+expected = (random.random(), np.random.rand())
+
+random.seed(0)
+np.random.seed(0)
+checkpoint = evolve_structure.load_checkpoint(plugin)
+assert checkpoint['gen_num'] == 3 and checkpoint['N_pop'] == 8, 'Checkpoint state incorrect!'
+assert np.array_equal(checkpoint['errors'], [1.0e-3, 2.0e-3]), 'Checkpoint errors incorrect!'
+assert [str(m) for m in checkpoint['models']] == [str(model), str(other)], 'Checkpoint models incorrect!'
+assert checkpoint['models'][1].get_params() == other.get_params(), 'Checkpoint parameters incorrect!'
+assert (random.random(), np.random.rand()) == expected, 'Random number generators not restored!'
+os.remove(os.path.join(plugin, 'checkpoint.pkl'))
+
+##########################################
+print('Testing generational run')
+random.seed(0x1234)
+N_pop, N_gens, N_survive = 4, 2, 2
+log_file = os.path.join(tmp_dir, 'generations.jsonl')
+with Telemetry(log_file) as telemetry:
+    survivors, errors, converge = evolve_structure.evolve_generations(StubPool(), get_population(N_pop), N_pop, N_gens, N_survive,
+                                                                      plugin, 'dry.wav', 'wet.wav', 'des.wav', 1e-9, telemetry)
+evaluations = read_events(log_file, 'evaluation')
+generations = read_events(log_file, 'generation')
+assert not converge and len(survivors) == N_survive and list(errors) == sorted(errors), 'Generational result incorrect!'
+assert [e['generation'] for e in generations] == list(range(N_gens)), 'Generation events incorrect! {}'.format(generations)
+assert len(evaluations) == sum(e['num_evaluations'] for e in generations) == N_pop + N_pop + 4, 'Evaluation events incorrect!'
+assert all(e['stage'] == 'full' and e['error'] == stub_error(range(e['num_params']), None) for e in evaluations), 'Evaluation events incorrect!'
+assert errors[0] == min(e['error'] for e in evaluations) and generations[-1]['errors'] == list(errors), 'Survivors incorrect!'
+os.remove(os.path.join(plugin, 'checkpoint.pkl'))
+
+##########################################
+print('Testing multi-fidelity run')
+fs = 8000
+x = 0.01 * np.random.default_rng(0x1234).standard_normal(fs).astype(np.float32)
+x[5000:5400] *= 50 # transient
+wavfile.write(os.path.join(tmp_dir, 'dry.wav'), fs, x)
+wavfile.write(os.path.join(tmp_dir, 'des.wav'), fs, 0.5 * x)
+excerpt = write_transient_excerpt(os.path.join(tmp_dir, 'dry.wav'), os.path.join(tmp_dir, 'des.wav'), 0.25, tmp_dir)
+_, excerpt_dry = wavfile.read(excerpt[0])
+assert len(excerpt_dry) == fs // 4 and np.max(np.abs(excerpt_dry)) == np.max(np.abs(x)), 'Excerpt missed the transient!'
+
+random.seed(0x1234)
+log_file = os.path.join(tmp_dir, 'multi_fidelity.jsonl')
+with Telemetry(log_file) as telemetry:
+    survivors, errors, converge = evolve_structure.evolve_generations(StubPool(), get_population(N_pop), N_pop, 1, N_survive,
+                                                                      plugin, 'dry.wav', 'wet.wav', 'des.wav', 1e-9, telemetry,
+                                                                      excerpt=excerpt)
+evaluations = read_events(log_file, 'evaluation')
+coarse = {e['index']: e['error'] for e in evaluations if e['stage'] == 'coarse'}
+full = {e['index']: e['error'] for e in evaluations if e['stage'] == 'full'}
+N_promote = max(N_survive, int(np.ceil(evolve_structure.PROMOTE_FRACTION * N_pop)))
+assert len(coarse) == N_pop and len(full) == N_promote, 'Candidates not promoted! {}'.format(evaluations)
+assert max(coarse[n] for n in full) <= min(coarse[n] for n in coarse if n not in full), 'Wrong candidates promoted!'
+assert len(survivors) == N_survive and list(errors) == sorted(full.values())[:N_survive], 'Multi-fidelity result incorrect!'
+assert read_events(log_file, 'generation')[0]['errors'] == list(errors), 'Generation event incorrect!'
+os.remove(os.path.join(plugin, 'checkpoint.pkl'))
+
+##########################################
+print('Testing steady-state run')
+random.seed(0x1234)
+log_file = os.path.join(tmp_dir, 'steady_state.jsonl')
+with Telemetry(log_file) as telemetry:
+    survivors, errors, converge = evolve_structure.evolve_steady_state(StubPool(), get_population(N_pop), N_pop, N_gens, N_survive,
+                                                                       plugin, 'dry.wav', 'wet.wav', 'des.wav', 1e-9, telemetry)
+evaluations = read_events(log_file, 'evaluation')
+generations = read_events(log_file, 'generation')
+assert not converge and len(survivors) == N_survive and list(errors) == sorted(errors), 'Steady-state result incorrect!'
+assert [e['generation'] for e in generations] == list(range(N_gens)), 'Generation events incorrect! {}'.format(generations)
+assert len(set(e['index'] for e in evaluations)) == len(evaluations), 'Evaluation indices not unique!'
+counted = [e['error'] for e in evaluations if e['generation'] < N_gens] # the rest finished after the last generation
+assert len(counted) == N_pop + N_pop + 4, 'Evaluation events incorrect!'
+assert list(errors) == sorted(counted)[:N_survive] and generations[-1]['errors'] == list(errors), 'Survivors incorrect!'
+os.remove(os.path.join(plugin, 'checkpoint.pkl'))
+
+##########################################
+print('Testing survivors that fail to compile')
+evolve_structure.compile_model = stub_compile_model
+save_survivors([model], plugin, 0, 1) # skipped, rather than ending the run
+assert os.listdir(plugin) == [], 'Failed survivor saved!'
+
+shutil.rmtree(tmp_dir)
+print('SUCCESS')
@@ -0,0 +1,216 @@
+"""
+Test the error functions used for parameter estimation
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from plugin_utils import read_wav, calc_error, TargetLoss, get_target_loss, StreamingLoss, calc_error_streaming
+from plugin_utils import SharedWavs, attach_shared_wavs, load_wav
+import plugin_utils
+from gen_faust import Model,Gain,UnitDelay,Delay,CubicNL,Split,Feedback,FB2
+from param_estimation import get_error_for_model_python, get_error_and_grad_for_model_python, optimize_model
+import param_estimation
+from scipy.io import wavfile
+
+import numpy as np
+import tempfile
+import shutil
+import scipy.signal as signal
+
+def reference_error(des_wav, out_wav, fs):
+    """Reference implementation of the error function"""
+    mean_square_error = np.mean((des_wav - out_wav)**2, axis=None)
+
+    des = (des_wav[:,0] + des_wav[:,1]) / 2
+    out = (out_wav[:,0] + out_wav[:,1]) / 2
+
+    _, _, Z_des = signal.stft(des, fs=fs, nperseg=2048, nfft=4096)
+    _, _, Z_out = signal.stft(out, fs=fs, nperseg=2048, nfft=4096)
+    freq_err = np.mean(np.abs(Z_des - Z_out), axis=None)
+
+    return mean_square_error + freq_err
+
+# read file
+fs, x = read_wav('audio_files/drums.wav')
+y = signal.lfilter([0.3, -0.4, 0.12], [1], x, axis=0)
+
+##########################################
+print('Testing cached target loss')
+loss = TargetLoss(y, fs)
+for out in [x, 0.5 * x, y, np.zeros_like(x)]:
+    err = np.abs(loss(out) - reference_error(y, out, fs))
+    assert err < 1.0e-12, 'Target loss incorrect! Error: {}'.format(err)
+
+    err = np.abs(calc_error(y, out, fs) - reference_error(y, out, fs))
+    assert err < 1.0e-12, 'calc_error incorrect! Error: {}'.format(err)
+
+##########################################
+print('Testing target loss from file')
+loss = get_target_loss('audio_files/drums.wav')
+assert loss is get_target_loss('audio_files/drums.wav'), 'Target loss not cached!'
+err = np.abs(loss(y) - reference_error(x, y, fs))
+assert err < 1.0e-12, 'Target loss (file) incorrect! Error: {}'.format(err)
+
+##########################################
+print('Testing streaming loss')
+for out in [x, 0.5 * x, y, np.zeros_like(x)]:
+    for block_size in [777, 4096, len(x)]:
+        loss = StreamingLoss()
+        for start in range(0, len(x), block_size):
+            loss.update(y[start:start+block_size], out[start:start+block_size])
+        err = np.abs(loss.result() - reference_error(y, out, fs))
+        assert err < 1.0e-12, 'Streaming loss incorrect! Error: {}'.format(err)
+
+err = np.abs(calc_error_streaming('audio_files/drums.wav', 'audio_files/drums.wav', block_size=5000))
+assert err < 1.0e-12, 'Streaming loss (file) incorrect! Error: {}'.format(err)
+
+# blocks are normalized in the same way as read_wav()
+_, blocks = plugin_utils.get_wav_blocks('audio_files/drums.wav', block_size=5000)
+assert np.max(np.abs(np.concatenate(list(blocks)) - x)) == 0, 'Streaming blocks incorrect!'
+
+# files of different lengths are an error, rather than silently truncated
+with tempfile.TemporaryDirectory() as tmp_dir:
+    short_file = os.path.join(tmp_dir, 'short.wav')
+    wavfile.write(short_file, fs, x[:-1])
+    try:
+        calc_error_streaming('audio_files/drums.wav', short_file, block_size=5000)
+        assert False, 'Streaming loss should fail for different lengths!'
+    except ValueError:
+        pass
+
+##########################################
+print('Testing loss gradient')
+np.random.seed(0x1234)
+out = y + 0.01 * np.random.randn(*np.shape(y))
+err, grad = TargetLoss(y, fs).grad(out)
+assert np.abs(err - reference_error(y, out, fs)) < 1.0e-12, 'Loss gradient error incorrect!'
+
+direction = np.random.randn(*np.shape(y))
+h = 1.0e-6
+grad_fd = (reference_error(y, out + h*direction, fs) - reference_error(y, out - h*direction, fs)) / (2*h)
+err = np.abs(grad_fd - np.sum(grad * direction))
+assert err < 1.0e-6, 'Loss gradient incorrect! Error: {}'.format(err)
+
+##########################################
+print('Testing model gradients')
+tmp_dir = tempfile.mkdtemp() # for the desired and rendered audio of the following tests
+wavfile.write(os.path.join(tmp_dir, 'grad_test.wav'), fs, y)
+
+fb2 = FB2()
+fb2.pole_mag = 0.3
+fb2.pole_angle = 0.6
+
+model1 = Model()
+model1.elements.append(Split([[Gain(0.5)], [UnitDelay(), Gain(-0.2)], [Delay(2), Gain(0.1)]]))
+model1.elements.append(Feedback([Gain(0.2)]))
+model2 = Model()
+model2.elements.append(Gain(1.5))
+model2.elements.append(CubicNL())
+model2.elements.append(fb2)
+model2.elements.append(Feedback([Split([[Gain(0.2)], [UnitDelay(), Gain(0.1)]]), Gain(-1.0)]))
+
+for model in [model1, model2]:
+    print(model)
+    params, _ = model.get_params()
+    params = np.array(params)
+    err, grad = get_error_and_grad_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+
+    for i in range(len(params)):
+        step = np.zeros_like(params)
+        step[i] = h
+        err_plus = get_error_for_model_python(params + step, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+        err_minus = get_error_for_model_python(params - step, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+        grad_fd = (err_plus - err_minus) / (2*h)
+        assert np.abs(grad_fd - grad[i]) < 1.0e-6, 'Model gradient incorrect! {} vs. {}'.format(grad[i], grad_fd)
+
+    # streaming render should match rendering the whole signal
+    param_estimation.STREAMING_BLOCK_SIZE = 5000
+    err_stream = get_error_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+    param_estimation.STREAMING_BLOCK_SIZE = None
+    err_full = get_error_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+    assert np.abs(err_stream - err_full) < 1.0e-9, 'Streaming render incorrect! {} vs. {}'.format(err_stream, err_full)
+
+##########################################
+print('Testing population errors')
+population = np.random.uniform(-0.9, 0.9, (5, len(model2.get_params()[0])))
+population[:,1:3] = np.random.uniform(0.1, 0.9, (5, 2)) # FB2 poles
+for batch_size in [None, 2]:
+    errors = param_estimation.get_errors_for_population(population, model2, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'),
+                                                        batch_size=batch_size)
+    for n in range(len(population)):
+        err = get_error_for_model_python(population[n], model2, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+        assert np.abs(errors[n] - err) < 1.0e-9 * max(1, err), 'Population error incorrect! {} vs. {}'.format(errors[n], err)
+
+##########################################
+print('Testing shared audio')
+with SharedWavs(['audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav')]) as handles:
+    attach_shared_wavs(handles)
+    fs_shared, x_shared = load_wav('audio_files/drums.wav')
+    assert fs_shared == fs and x_shared.dtype == np.float32, 'Audio not shared!'
+    assert np.max(np.abs(x_shared - x)) == 0, 'Shared audio incorrect!'
+
+    for model in [model1, model2]:
+        params, _ = model.get_params()
+        plugin_utils.loss_cache.clear()
+        err_shared = get_error_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+        plugin_utils.shared_wavs.clear()
+        plugin_utils.loss_cache.clear()
+        err = get_error_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+        assert np.abs(err_shared - err) < 1.0e-12, 'Shared audio error incorrect! {} vs. {}'.format(err_shared, err)
+        attach_shared_wavs(handles)
+
+plugin_utils.shared_wavs.clear()
+
+##########################################
+print('Testing optimization pruning')
+for prune_error, pruned in [(None, False), (1.0, False), (1.0e-6, True)]:
+    model = Model()
+    model.elements.append(Gain(0.9))
+    model.elements.append(Feedback([UnitDelay(), Gain(0.5)]))
+    stats = {}
+    params = optimize_model(model, 'prune_test', 'audio_files/drums.wav', os.path.join(tmp_dir, 'prune_test.wav'), os.path.join(tmp_dir, 'grad_test.wav'),
+                            backend='python', stats=stats, prune_error=prune_error)
+    assert stats['pruned'] == pruned, 'Optimization pruning incorrect! {}'.format(stats)
+    if pruned:
+        err = get_error_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+        assert stats['nit'] < 40 and err == stats['pruned_error'], 'Pruned optimization did not return best parameters!'
+
+##########################################
+print('Testing least squares optimization')
+model = Model()
+model.elements.append(Split([[Gain()], [UnitDelay(), Gain()], [Delay(2), Gain()]]))
+stats = {}
+params = optimize_model(model, 'linear_test', 'audio_files/drums.wav', os.path.join(tmp_dir, 'linear_test.wav'), os.path.join(tmp_dir, 'grad_test.wav'),
+                        backend='python', stats=stats)
+assert stats['linear'] and stats['nit'] == 0, 'Least squares not used! {}'.format(stats)
+err = np.max(np.abs(params - np.array([0.3, -0.4, 0.12])))
+assert err < 1.0e-9, 'Least squares parameters incorrect! Error: {}'.format(err)
+
+# (target not reachable by this model: least squares parameters are only polished)
+model = Model()
+model.elements.append(Split([[Gain()], [UnitDelay(), Gain()]]))
+params_ls = param_estimation.get_linear_params(model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+err_ls = get_error_for_model_python(params_ls, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+stats = {}
+params = optimize_model(model, 'linear_test', 'audio_files/drums.wav', os.path.join(tmp_dir, 'linear_test.wav'), os.path.join(tmp_dir, 'grad_test.wav'),
+                        backend='python', stats=stats)
+assert not stats['linear'] and stats['linear_polish'], 'Least squares fall through not recorded! {}'.format(stats)
+assert stats['nit'] <= param_estimation.LINEAR_POLISH_MAXITER, 'Least squares parameters not just polished! {}'.format(stats)
+err = get_error_for_model_python(params, model, 'audio_files/drums.wav', os.path.join(tmp_dir, 'grad_test.wav'))
+assert err <= err_ls, 'Polished parameters worse than least squares! {} vs. {}'.format(err, err_ls)
+
+##########################################
+print('Testing bounded caches')
+plugin_utils.shared_wavs.clear()
+wav_files = [os.path.join(tmp_dir, 'cache_test{}.wav'.format(n)) for n in range(plugin_utils.WAV_CACHE_SIZE + 2)]
+for n, wav_file in enumerate(wav_files):
+    wavfile.write(wav_file, 8000, np.full((16, 2), n / 16, dtype=np.float32))
+    load_wav(wav_file)
+    get_target_loss(wav_file)
+assert len(plugin_utils.wav_cache) == plugin_utils.WAV_CACHE_SIZE, 'Wav cache not bounded!'
+assert len(plugin_utils.loss_cache) == plugin_utils.LOSS_CACHE_SIZE, 'Loss cache not bounded!'
+assert [key[0] for key in plugin_utils.wav_cache] == wav_files[-plugin_utils.WAV_CACHE_SIZE:], 'Least recently used wavs not evicted!'
+assert np.all(load_wav(wav_files[-1])[1] == (len(wav_files) - 1) / 16), 'Cached wav incorrect!'
+
+shutil.rmtree(tmp_dir)
+print('SUCCESS')
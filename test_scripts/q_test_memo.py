@@ -0,0 +1,53 @@
+"""
+Test the persistent fitness memo
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from gen_faust import Model,Gain,UnitDelay,Delay,Split,Feedback
+from fitness_memo import FitnessMemo, get_target_fingerprint
+import pickle
+import tempfile
+
+db_file = os.path.join(tempfile.mkdtemp(), 'memo.sqlite')
+target = get_target_fingerprint('audio_files/drums.wav', 'audio_files/drums.wav')
+memo = FitnessMemo(db_file, target)
+
+def get_model(delay_len, gain):
+    model = Model()
+    model.elements.append(Split([[Gain(gain)], [Delay(delay_len), Gain(0.5)]]))
+    return model
+
+##########################################
+print('Testing memo lookup')
+model = get_model(10, 0.2)
+assert memo.lookup(model) is None, 'Empty memo should miss!'
+memo.store(model, [0.3, 0.4], 1.0e-3)
+params, error = memo.lookup(get_model(10, 0.9))
+assert params == [0.3, 0.4] and error == 1.0e-3, 'Memo lookup incorrect!'
+
+# only better results replace stored results
+memo.store(model, [0.1, 0.1], 1.0e-2)
+assert memo.lookup(model) == ([0.3, 0.4], 1.0e-3), 'Memo replaced with worse result!'
+memo.store(model, [0.5, 0.6], 1.0e-4)
+assert memo.lookup(model) == ([0.5, 0.6], 1.0e-4), 'Memo not updated with better result!'
+
+##########################################
+print('Testing near lookup')
+assert memo.lookup(get_model(20, 0.2)) is None, 'Different delay length should miss!'
+assert memo.lookup_near(get_model(20, 0.2)) == ([0.5, 0.6], 1.0e-4), 'Near lookup incorrect!'
+other = Model()
+other.elements.append(Feedback([UnitDelay(), Gain(0.5)]))
+assert memo.lookup_near(other) is None, 'Different structure should miss!'
+
+##########################################
+print('Testing memo in other processes and targets')
+memo2 = pickle.loads(pickle.dumps(memo))
+assert memo2.lookup(model) == ([0.5, 0.6], 1.0e-4), 'Pickled memo incorrect!'
+memo3 = FitnessMemo(db_file, target[::-1])
+assert memo3.lookup(model) is None, 'Memo should depend on target!'
+
+for m in [memo, memo2, memo3]:
+    m.close()
+
+print('SUCCESS')
@@ -0,0 +1,69 @@
+"""
+Test the flat array-backed model representation
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from gen_faust import Model,Gain,UnitDelay,Delay,CubicNL,Split,Feedback,FB2
+from model_ir import ModelIR
+import numpy as np
+import pickle
+
+fb2 = FB2()
+fb2.pole_mag = 0.3
+fb2.pole_angle = 0.6
+
+model = Model()
+model.elements.append(Split([[Gain(0.5), Feedback([Delay(5), Gain(0.3)])],
+                             [UnitDelay(), Split([[Gain(0.7)], [Delay(20), Gain(0.2)]])],
+                             [Feedback([]), Gain(0.6)], []]))
+model.elements.append(CubicNL())
+model.elements.append(fb2)
+model.elements.append(Gain(0.9))
+
+np.random.seed(0x5678)
+x = 0.5 * np.random.randn(1000, 2)
+
+##########################################
+print('Testing IR round trip')
+ir = ModelIR.from_model(model)
+new_model = ir.to_model()
+assert new_model.get_topology() == model.get_topology(), 'IR topology incorrect!'
+assert new_model.get_params() == model.get_params(), 'IR parameters incorrect!'
+assert np.max(np.abs(new_model.process(x) - model.process(x))) == 0, 'IR model output incorrect!'
+
+empty_ir = ModelIR.from_model(Model())
+assert len(empty_ir) == 1 and empty_ir.to_model().elements == [], 'Empty IR incorrect!'
+
+##########################################
+print('Testing IR parameters')
+params, bounds = ir.get_params()
+model_params, model_bounds = model.get_params()
+assert np.array_equal(params, model_params) and np.array_equal(bounds, model_bounds), 'IR get_params incorrect!'
+
+ir2 = ir.copy()
+new_params = np.linspace(0.1, 0.9, len(params))
+ir2.set_params(new_params)
+assert np.array_equal(ir.params, model_params), 'IR copy shares parameters!'
+model.set_params(new_params)
+assert ir2.to_model().get_params() == model.get_params(), 'IR set_params incorrect!'
+assert ir2.to_model().get_topology() == ir.to_model().get_topology(), 'IR copy structure incorrect!'
+
+##########################################
+print('Testing IR serialization')
+ir3 = pickle.loads(pickle.dumps(ir2))
+assert ir3.to_model().get_topology() == ir2.to_model().get_topology() and np.array_equal(ir3.params, ir2.params), 'IR pickle incorrect!'
+
+class Unknown(Gain):
+    pass
+
+other = Model()
+other.elements.append(Delay(4))
+other.elements.append(Unknown())
+try:
+    ModelIR.from_model(other)
+    assert False, 'IR should not support unknown elements!'
+except TypeError:
+    pass
+
+print('SUCCESS')
@@ -5,6 +5,9 @@ Test model utilities including equality and trimming
 import os,sys
 sys.path.append(os.path.abspath('crossroads_scripts'))
 from gen_faust import *
+import evolve_structure
+import numpy as np
+import random
 
 ##########################################
 print('Testing Model Equality: types')
@@ -236,4 +239,169 @@ model2.elements.append(Feedback([Gain(1.0), UnitDelay(), UnitDelay(), Gain(1.5),
 model2.trim_model()
 assert model1 == model2, 'Trim (feedback) incorrect!'
 
+##########################################
+print('Testing Model Trim: identity elements')
+model1 = Model()
+model1.elements.append(Delay(0))
+model1.elements.append(Split([[Gain(0.5), Feedback([])]]))
+model1.elements.append(Delay(1))
+model1.trim_model()
+model2 = Model()
+model2.elements.append(Gain(0.5))
+model2.elements.append(UnitDelay())
+assert model1 == model2, 'Trim (identity) incorrect!'
+
+##########################################
+print('Testing Model Trim: gains through linear elements')
+model1 = Model()
+model1.elements.append(Gain(0.5))
+model1.elements.append(Delay(3))
+model1.elements.append(Gain(2.0))
+model1.elements.append(CubicNL())
+model1.elements.append(Gain(3.0))
+model1.trim_model()
+model2 = Model()
+model2.elements.append(Gain(1.0))
+model2.elements.append(Delay(3))
+model2.elements.append(CubicNL())
+model2.elements.append(Gain(3.0))
+assert model1 == model2, 'Trim (gains through linear elements) incorrect!'
+
+# gains are folded into every chain of a split
+model1 = Model()
+model1.elements.append(Gain(2.0))
+model1.elements.append(Split([[Gain(0.5)], [UnitDelay(), Gain(0.25)]]))
+model1.trim_model()
+model2 = Model()
+model2.elements.append(Split([[Gain(1.0)], [UnitDelay(), Gain(0.5)]]))
+assert model1 == model2, 'Trim (gains into split) incorrect!'
+
+##########################################
+print('Testing Model Trim: nested split')
+model1 = Model()
+model1.elements.append(Split([[Gain(0.5)], [Split([[UnitDelay(), Gain(0.2)], [Delay(2), Gain(0.3)]])]]))
+model1.trim_model()
+model2 = Model()
+model2.elements.append(Split([[Gain(0.5)], [UnitDelay(), Gain(0.2)], [Delay(2), Gain(0.3)]]))
+assert model1 == model2, 'Trim (nested split) incorrect!'
+
+##########################################
+print('Testing Model Trim: common split elements')
+model1 = Model()
+model1.elements.append(Split([[UnitDelay(), Gain(0.5), Delay(2)], [Delay(3), Gain(0.2), UnitDelay()]]))
+model1.trim_model()
+model2 = Model()
+model2.elements.append(UnitDelay())
+model2.elements.append(Split([[Gain(0.5), UnitDelay()], [Delay(2), Gain(0.2)]]))
+model2.elements.append(UnitDelay())
+assert model1 == model2, 'Trim (common split elements) incorrect!'
+
+##########################################
+print('Testing Model Trim: output and parameters')
+fb2 = FB2()
+model = Model()
+model.elements.append(Gain(0.8))
+model.elements.append(Split([[Delay(2), Gain(0.5), Split([[UnitDelay(), Gain(-0.3)], [Delay(4), Gain(0.2)]])],
+                             [Split([[UnitDelay(), CubicNL(), Gain(0.7)]])]]))
+model.elements.append(Feedback([Gain(0.5), UnitDelay(), Delay(0), Gain(0.6)]))
+model.elements.append(fb2)
+model.elements.append(Gain(1.5))
+
+np.random.seed(0x1234)
+x = 0.5 * np.random.randn(1000, 2)
+params_before, _ = model.get_params()
+y_before = model.process(x)
+model.reset()
+model.trim_model()
+params, bounds = model.get_params()
+assert len(params) < len(params_before) and len(params) == len(bounds), 'Trim (parameters) incorrect!'
+
+model.set_params(params)
+err = np.max(np.abs(model.process(x) - y_before))
+assert err < 1.0e-12, 'Trim changed model output! Error: {}'.format(err)
+
+##########################################
+print('Testing Model structure hash')
+def get_model(*elements):
+    model = Model()
+    model.elements = list(elements)
+    return model
+
+same_structures = [
+    # parameter values
+    (get_model(Gain(0.5), Delay(3)), get_model(Gain(2.0), Delay(3))),
+    # split chain order
+    (get_model(Split([[Gain()], [UnitDelay(), Gain()], [Delay(2), Gain()]])),
+     get_model(Split([[Delay(2), Gain()], [Gain()], [UnitDelay(), Gain()]]))),
+    # linear elements commute
+    (get_model(Gain(), Delay(2), Feedback([UnitDelay(), Gain()]), CubicNL()),
+     get_model(Feedback([UnitDelay(), Gain()]), UnitDelay(), Gain(), UnitDelay(), CubicNL())),
+    # recursive
+    (get_model(Split([[Gain()], [Feedback([Split([[Gain()], [UnitDelay()]])])]])),
+     get_model(Split([[Feedback([Split([[UnitDelay()], [Gain()]])])], [Gain()]]))),
+]
+different_structures = [
+    (get_model(Gain(), CubicNL()), get_model(CubicNL(), Gain())),
+    (get_model(Delay(2)), get_model(Delay(3))),
+    (get_model(Split([[Gain()], [UnitDelay(), Gain()]])), get_model(Split([[Gain()], [UnitDelay()], [Gain()]]))),
+]
+for model1, model2 in same_structures:
+    assert model1.get_structure_hash() == model2.get_structure_hash(), 'Structure hash should match! {} vs. {}'.format(model1, model2)
+for model1, model2 in different_structures:
+    assert model1.get_structure_hash() != model2.get_structure_hash(), 'Structure hash should differ! {} vs. {}'.format(model1, model2)
+
+##########################################
+print('Testing Model linearity in parameters')
+linear_models = [
+    [Gain()],
+    [Split([[Gain()], [UnitDelay(), Gain()], [Delay(2), Gain()]])],
+    [Feedback([UnitDelay()]), Split([[], [Delay(3), Gain(), UnitDelay()]])],
+]
+nonlinear_models = [
+    [Gain(), Split([[Gain()], [UnitDelay(), Gain()]])],
+    [Gain(), CubicNL()],
+    [Feedback([UnitDelay(), Gain()])],
+    [FB2()],
+]
+for elements, linear in [(e, True) for e in linear_models] + [(e, False) for e in nonlinear_models]:
+    model = Model()
+    model.elements = elements
+    assert model.is_linear_in_params() == linear, 'Linearity incorrect! {}'.format(model)
+
+##########################################
+print('Testing mutated models keep fitted parameters')
+def get_parents():
+    parent1 = Model()
+    parent1.elements = [Split([[Gain(0.3)], [UnitDelay(), Gain(-0.2)]])]
+    parent2 = Model()
+    parent2.elements = [Delay(3), Gain(0.4)]
+    return parent1, parent2
+
+def get_output(model, x):
+    model.reset()
+    return model.process(x)
+
+x = np.random.default_rng(0x89ab).standard_normal(64)
+random.seed(0x89ab)
+mutation_strategies = evolve_structure.mutation_strategies
+for strategy in mutation_strategies:
+    evolve_structure.mutation_strategies = [strategy]
+    for _ in range(10):
+        parent1, parent2 = get_parents()
+        child = evolve_structure.get_mutated_model(parent1, parent2)
+        y1, y2, y = get_output(parent1, x), get_output(parent2, x), get_output(child, x)
+        if strategy == 'concat_series':
+            expected = [get_output(parent2, y1), get_output(parent1, y2)]
+        elif strategy == 'concat_parallel':
+            expected = [y1 + y2]
+        elif strategy in ['add_gain', 'add_split', 'add_chain']: # new elements start out as no-ops
+            expected = [y1, y2]
+        else:
+            params = sorted(child.get_params()[0])
+            assert params in [sorted(parent1.get_params()[0]), sorted(parent2.get_params()[0])], \
+                'Parameters not inherited! {}: {}'.format(strategy, child)
+            continue
+        assert any(np.allclose(y, e) for e in expected), 'Mutation changed the output! {}: {}'.format(strategy, child)
+evolve_structure.mutation_strategies = mutation_strategies
+
 print('SUCCESS')
@@ -0,0 +1,162 @@
+"""
+Test the Python simulation backend against reference
+implementations of each signal processing element
+"""
+
+import os,sys
+sys.path.append(os.path.abspath('crossroads_scripts'))
+from gen_faust import Model,Element,Gain,UnitDelay,Delay,CubicNL,Split,Feedback,FB2
+from plugin_utils import read_wav
+from param_estimation import ParamSampler, render_model_python
+
+import numpy as np
+import scipy.signal as signal
+
+# read file
+fs, x = read_wav('audio_files/drums.wav')
+x = x[:20000]
+
+def filt(b, a, x):
+    """Reference filter applied to each channel"""
+    return signal.lfilter(b, a, x, axis=0)
+
+def check_model(name, model, y_ref, tol=1.0e-9):
+    """Check the model output against a reference, both in one block and in many"""
+    print(f'Testing {name}')
+    model.reset()
+    y = model.process(x)
+    err = np.max(np.abs(y - y_ref))
+    assert err < tol, '{} incorrect! Error: {}'.format(name, err)
+
+    model.reset()
+    y_blocks = np.concatenate([model.process(x[n:n+512]) for n in range(0, len(x), 512)])
+    err = np.max(np.abs(y_blocks - y_ref))
+    assert err < tol, '{} (blocks) incorrect! Error: {}'.format(name, err)
+
+# Gain
+model = Model()
+model.elements.append(Gain(-0.2))
+check_model('Gain', model, -0.2 * x)
+
+# Delays
+model = Model()
+model.elements.append(UnitDelay())
+model.elements.append(Delay(4))
+check_model('Delay', model, filt([0, 0, 0, 0, 0, 1], [1], x))
+
+# FIR filter
+b = [0.3, -0.4, 0.12, 0.2, -0.75]
+model = Model()
+model.elements.append(Split([[Gain(b[0])], [UnitDelay(),Gain(b[1])], [Delay(2),Gain(b[2])],
+    [Delay(3),Gain(b[3])], [Delay(4),Gain(b[4])]]))
+check_model('FIR filter', model, filt(b, [1], x))
+
+# Soft-clip distortion
+x_in = np.clip(2.0 * x, -1, 1)
+model = Model()
+model.elements.append(Gain(2.0))
+model.elements.append(CubicNL())
+check_model('Soft-clip', model, x_in - x_in**3 / 3)
+
+# One-pole filter
+model = Model()
+model.elements.append(Feedback([Gain(-0.2)]))
+check_model('One-pole', model, filt([1], [1, 0.2], x))
+
+# Two-pole filter
+fb = FB2()
+fb.pole_mag = 0.2
+fb.pole_angle = 1.0
+poly = np.poly((0.2 * np.exp(1j), 0.2 * np.exp(-1j)))
+model = Model()
+model.elements.append(fb)
+check_model('Two-pole', model, filt([1], np.real(poly), x))
+
+# Lowpass filter (direct form II)
+b, a = signal.butter(2, 0.1)
+model = Model()
+model.elements.append(Feedback([Split([[Gain(a[1])], [UnitDelay(), Gain(a[2])]]), Gain(-1.0)]))
+model.elements.append(Split([[Gain(b[0])], [UnitDelay(), Gain(b[1])], [UnitDelay(), UnitDelay(), Gain(b[2])]]))
+check_model('DF2', model, filt(b, a, x))
+
+# Nonlinear feedback
+y_ref = np.zeros_like(x)
+state = np.zeros(2)
+for n in range(len(x)):
+    y_ref[n] = x[n] + state
+    v = np.clip(0.5 * y_ref[n], -1, 1)
+    state = v - v**3 / 3
+
+model = Model()
+model.elements.append(Feedback([Gain(0.5), CubicNL()]))
+check_model('Nonlinear feedback', model, y_ref)
+
+# Batched rendering
+print('Testing batched rendering')
+np.random.seed(0x3456)
+model1 = Model()
+model1.elements.append(Split([[Gain()], [UnitDelay(), Gain()], [Delay(2), Gain()]]))
+model1.elements.append(CubicNL())
+model2 = Model()
+model2.elements.append(Gain())
+model2.elements.append(Feedback([UnitDelay(), Gain()]))
+model3 = Model() # IIR filters, and a nonlinear feedback loop
+model3.elements.append(FB2())
+model3.elements.append(Split([[Gain()], [Feedback([Delay(3), Gain()]), Gain()]]))
+model3.elements.append(Feedback([CubicNL(), Gain()]))
+for model in [model1, model2, model3]:
+    params, _ = model.get_params()
+    population = np.random.uniform(-0.9, 0.9, (5, len(params)))
+    y_batch = model.process_batch(x, population)
+
+    for n in range(len(population)):
+        model.set_params(population[n])
+        model.reset()
+        err = np.max(np.abs(y_batch[...,n] - model.process(x)))
+        assert err < 1.0e-12, 'Batched rendering incorrect! Error: {}'.format(err)
+
+# Transfer function rendering
+print('Testing transfer function rendering')
+fb2 = FB2()
+fb2.pole_mag = 0.5
+fb2.pole_angle = 0.3
+model1 = Model()
+model1.elements.append(Split([[Gain(0.3)], [UnitDelay(), Gain(-0.2)], [Delay(4), Gain(0.1)]]))
+model2 = Model()
+model2.elements.append(Gain(0.8))
+model2.elements.append(Feedback([Delay(10), Gain(0.5)]))
+model2.elements.append(fb2)
+model2.elements.append(Split([[Gain(0.5)], [Feedback([UnitDelay(), Gain(-0.4)]), Gain(0.3)]]))
+model3 = Model()
+model3.elements.append(Split([[Gain(0.3)], [Delay(500), Gain(0.2)]]))
+model4 = Model()
+model4.elements.append(Feedback([UnitDelay(), Gain(0.5), CubicNL()]))
+for model, linear in [(model1, True), (model2, True), (model3, True), (model4, False)]:
+    assert (model.get_tf() is not None) == linear, 'Model transfer function incorrect!'
+    model.reset()
+    y_ref = model.process(x)
+    err = np.max(np.abs(render_model_python(model, x) - y_ref))
+    assert err < 1.0e-12, 'Transfer function rendering incorrect! Error: {}'.format(err)
+
+# Population sampling
+print('Testing population sampling')
+fb2 = FB2()
+model = Model()
+model.elements.append(Split([[Gain()], [UnitDelay(), Gain()]]))
+model.elements.append(fb2)
+params, bounds = model.get_params()
+bounds = np.array(bounds)
+sampler = ParamSampler(bounds, seed=0x4567)
+population = sampler.random(10000)
+assert population.shape == (10000, len(params)), 'Population shape incorrect!'
+assert np.all(population >= bounds[:,0]) and np.all(population <= bounds[:,1]), 'Population out of bounds!'
+assert np.array_equal(population, ParamSampler(bounds, seed=0x4567).random(10000)), 'Seeded population not reproducible!'
+
+parents = np.array([params, np.clip(np.array(params) + 0.1, bounds[:,0], bounds[:,1])])
+children = sampler.sample(parents, 10000, 1.0e-3)
+assert children.shape == (10000, len(params)), 'Mutated population shape incorrect!'
+for n in range(len(parents)):
+    err = np.max(np.abs(np.mean(children[n::2], axis=0) - parents[n]))
+    assert err < 1.0e-3, 'Mutated population incorrect! Error: {}'.format(err)
+
+print('SUCCESS')